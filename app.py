@@ -3,21 +3,53 @@
 # Sistema completo de gerenciamento de tickets
 # =====================================================
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import (
+    Flask, render_template, request, jsonify, session, redirect, url_for, Response, g, has_request_context
+)
 from flask_cors import CORS
+import click
 import os
 import json
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-import sqlite3
 import secrets
+import base64
+import time
+import queue
+import threading
+import hmac
+import hashlib
+import re
+import csv
+import io
+import math
+import zlib
+import contextvars
+from contextlib import contextmanager
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from database import (
+    get_db, get_archive_db, read_snapshot, run_blocking, iterate_blocking, native_lock,
+    set_query_observer, WriteQueue, ARCHIVE_PATH
+)
+from cache import TTLCache
+from discord_client import DiscordClient, DiscordAPIError
+from events import EventBus, format_sse
+from jobs import JobQueue, create_jobs_table
+from sessions import SessionStore, ServerSessionInterface, create_sessions_table
+from metrics import Registry, statement_label, DB_BUCKETS
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32))
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)  # Sessão expira em 1 hora
 CORS(app)
 
+# Sessões no servidor: o cookie leva só um id (ver sessions.py)
+session_store = SessionStore()
+app.session_interface = ServerSessionInterface(session_store)
+
 # =====================================================
 # CONFIGURAÇÕES DISCORD OAUTH2
 # =====================================================
@@ -26,10 +58,16 @@ DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET', '')
 DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI', 'http://localhost:5000/callback')
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_TOKEN', '')
 
-DISCORD_API_URL = 'https://discord.com/api/v10'
+DISCORD_API_URL = os.getenv('DISCORD_API_URL', 'https://discord.com/api/v10')  # trocado só em testes/benchmark
 OAUTH2_URL = f'{DISCORD_API_URL}/oauth2/authorize'
 TOKEN_URL = f'{DISCORD_API_URL}/oauth2/token'
 
+# Cliente único (sessão keep-alive + rate limit) para todas as chamadas ao Discord
+discord_api = DiscordClient(base_url=DISCORD_API_URL, bot_token=DISCORD_BOT_TOKEN)
+
+# Threads para chamadas ao Discord feitas em paralelo dentro de uma requisição
+discord_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DISCORD_EXECUTOR_WORKERS', 8)))
+
 # IDs dos cargos permitidos (apenas staff para cima)
 ALLOWED_ROLES = [
     1365636960651051069,  # 🔥 Founder (mais alto)
@@ -40,12 +78,26 @@ ALLOWED_ROLES = [
 
 GUILD_ID = os.getenv('GUILD_ID', '1365510151884378214')
 
+# Segredo compartilhado com o bot para os webhooks (/api/webhook/*)
+DASHBOARD_SECRET = os.getenv('DASHBOARD_SECRET', '')
+
+# URL do bot no Render
+BOT_URL = os.getenv('BOT_URL', 'https://caosbot-discord.onrender.com')
+
 # =====================================================
 # BANCO DE DADOS
 # =====================================================
 def init_db():
     """Inicializa o banco de dados SQLite"""
-    conn = sqlite3.connect('tickets.db')
+    with get_db() as conn:
+        _create_schema(conn)
+    with get_archive_db() as conn:
+        create_archive_schema(conn)
+        conn.commit()
+    print("✅ Banco de dados inicializado!")
+
+def _create_schema(conn):
+    """Cria as tabelas (idempotente)"""
     c = conn.cursor()
     
     # Tabela de categorias de tickets
@@ -123,9 +175,696 @@ def init_db():
         value TEXT
     )''')
     
+    # Índices das consultas mais frequentes (ver HOT_QUERIES / flask check-indexes)
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_tickets_status_created
+        ON tickets (status, created_at DESC, id DESC)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_ticket_messages_ticket_created
+        ON ticket_messages (ticket_id, created_at, id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_categories_created
+        ON categories (created_at DESC)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_panels_created
+        ON panels (created_at DESC)''')
+    # Janelas de tempo do agregador de analytics
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_tickets_created
+        ON tickets (created_at)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_tickets_closed
+        ON tickets (closed_at)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_ticket_messages_created
+        ON ticket_messages (created_at)''')
+    
+    _create_analytics_tables(conn)
+    _create_ticket_counters(conn)
+    _create_ticket_events(conn)
+    _create_table_versions(conn)
+    create_jobs_table(conn)
+    create_sessions_table(conn)
+    _create_search_index(conn)
+    
+    # Configuração padrão dos sistemas (a leitura nunca precisa gravar)
+    c.execute("INSERT OR IGNORE INTO config (key, value) VALUES ('welcome_config', ?)",
+              (json.dumps(DEFAULT_WELCOME_CONFIG),))
+    
     conn.commit()
-    conn.close()
-    print("✅ Banco de dados inicializado!")
+    
+    # Atualiza as estatísticas do planejador quando necessário (barato)
+    c.execute("PRAGMA optimize")
+
+# =====================================================
+# CONTADORES DE TICKETS (estatísticas O(1))
+# =====================================================
+# Cada linha de ticket_counters guarda um agregado (scope, key) mantido por
+# triggers na mesma transação que altera `tickets`, então /api/stats só lê
+# algumas dezenas de linhas em vez de varrer a tabela inteira.
+#   total/''           -> número total de tickets
+#   status/<status>    -> tickets por status
+#   category/<id>      -> tickets por categoria ('' = sem categoria)
+#   priority/<nome>    -> tickets por prioridade
+#   waiting/''         -> tickets abertos ainda sem staff atribuído
+#   resolution/count   -> tickets fechados com closed_at
+#   resolution/seconds -> soma do tempo até o fechamento (segundos)
+TICKET_COUNTER_TRIGGERS = ('tickets_counters_ai', 'tickets_counters_ad', 'tickets_counters_au')
+
+def _counter_deltas(row, sign):
+    """Gera os UPSERTs que aplicam `sign` (+1/-1) aos contadores de `row` (NEW/OLD)"""
+    upsert = (
+        "INSERT INTO ticket_counters (scope, key, value) "
+        "SELECT {scope}, {key}, {value} WHERE {cond} "
+        "ON CONFLICT(scope, key) DO UPDATE SET value = value + excluded.value;"
+    )
+    closed = f"{row}.status = 'closed' AND {row}.closed_at IS NOT NULL AND {row}.created_at IS NOT NULL"
+    deltas = [
+        ("'total'", "''", sign, '1'),
+        ("'status'", f"COALESCE({row}.status, '')", sign, '1'),
+        ("'category'", f"COALESCE(CAST({row}.category_id AS TEXT), '')", sign, '1'),
+        ("'priority'", f"COALESCE({row}.priority, '')", sign, '1'),
+        ("'waiting'", "''", sign, f"{row}.status = 'open' AND {row}.assigned_to IS NULL"),
+        ("'resolution'", "'count'", sign, closed),
+        ("'resolution'", "'seconds'",
+         f"{sign} * (julianday({row}.closed_at) - julianday({row}.created_at)) * 86400", closed),
+    ]
+    return '\n'.join(
+        upsert.format(scope=scope, key=key, value=value, cond=cond)
+        for scope, key, value, cond in deltas
+    )
+
+def _create_ticket_counters(conn):
+    """Cria a tabela de contadores e os triggers que a mantêm"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS ticket_counters (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value NUMERIC NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, key)
+    ) WITHOUT ROWID''')
+    
+    existing = {row[0] for row in c.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?, ?)",
+        TICKET_COUNTER_TRIGGERS
+    )}
+    if existing == set(TICKET_COUNTER_TRIGGERS):
+        return
+    
+    for name in TICKET_COUNTER_TRIGGERS:
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    
+    c.execute(f'''CREATE TRIGGER tickets_counters_ai AFTER INSERT ON tickets BEGIN
+        {_counter_deltas('NEW', 1)}
+    END''')
+    c.execute(f'''CREATE TRIGGER tickets_counters_ad AFTER DELETE ON tickets BEGIN
+        {_counter_deltas('OLD', -1)}
+    END''')
+    c.execute(f'''CREATE TRIGGER tickets_counters_au
+        AFTER UPDATE OF status, category_id, priority, assigned_to, created_at, closed_at ON tickets
+    BEGIN
+        {_counter_deltas('OLD', -1)}
+        {_counter_deltas('NEW', 1)}
+    END''')
+    
+    # Triggers novos: recalcula a partir dos tickets já existentes
+    rebuild_ticket_counters(conn)
+
+def _counter_aggregates_sql(source, where='1'):
+    """SELECT com as linhas (scope, key, value) dos tickets de `source` que atendem `where`"""
+    closed = "status = 'closed' AND closed_at IS NOT NULL AND created_at IS NOT NULL"
+    return f'''
+        WITH src AS (SELECT * FROM {source} WHERE {where})
+        SELECT 'total' AS scope, '' AS key, COUNT(*) AS value FROM src
+        UNION ALL
+        SELECT 'status', COALESCE(status, ''), COUNT(*) FROM src GROUP BY 2
+        UNION ALL
+        SELECT 'category', COALESCE(CAST(category_id AS TEXT), ''), COUNT(*) FROM src GROUP BY 2
+        UNION ALL
+        SELECT 'priority', COALESCE(priority, ''), COUNT(*) FROM src GROUP BY 2
+        UNION ALL
+        SELECT 'waiting', '', COUNT(*) FROM src WHERE status = 'open' AND assigned_to IS NULL
+        UNION ALL
+        SELECT 'resolution', 'count', COUNT(*) FROM src WHERE {closed}
+        UNION ALL
+        SELECT 'resolution', 'seconds',
+               COALESCE(SUM((julianday(closed_at) - julianday(created_at)) * 86400), 0)
+            FROM src WHERE {closed}
+    '''
+
+def add_ticket_counters(conn, source, where='1', params=()):
+    """Soma aos contadores os agregados dos tickets de `source` que atendem `where`"""
+    conn.execute(f'''
+        INSERT INTO ticket_counters (scope, key, value)
+        SELECT scope, key, value FROM ({_counter_aggregates_sql(source, where)}) WHERE true
+        ON CONFLICT(scope, key) DO UPDATE SET value = value + excluded.value
+    ''', params)
+
+def rebuild_ticket_counters(conn):
+    """Recalcula todos os contadores a partir da tabela tickets (uma única varredura)
+
+    Tickets já arquivados (ver ARQUIVAMENTO) continuam contando. Confirma a
+    transação em andamento (ATTACH não pode acontecer dentro de uma).
+    """
+    if conn.in_transaction:
+        conn.commit()
+    with attached_archive(conn):
+        conn.execute("DELETE FROM ticket_counters")
+        add_ticket_counters(conn, 'tickets')
+        add_ticket_counters(conn, 'archive.archived_tickets')
+
+# =====================================================
+# LOG DE EVENTOS DE TICKETS (alimenta o /api/events)
+# =====================================================
+# Triggers registram cada criação/alteração de ticket em ticket_events, não
+# importa quem escreveu (webhook em qualquer worker ou o próprio bot). Cada
+# worker lê esse log com uma consulta por intervalo e repassa às conexões SSE.
+def _create_ticket_events(conn):
+    """Cria a tabela de eventos e os triggers que a alimentam"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS ticket_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        ticket_id INTEGER,
+        ticket_number INTEGER,
+        status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tickets_events_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO ticket_events (event, ticket_id, ticket_number, status)
+        VALUES ('ticket_created', NEW.id, NEW.ticket_number, NEW.status);
+    END''')
+    # Só as colunas que o dashboard mostra: novas mensagens (messages_count)
+    # não geram evento. Bancos antigos tinham o trigger em qualquer UPDATE.
+    previous = c.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'tickets_events_au'"
+    ).fetchone()
+    if previous and 'UPDATE OF' not in previous[0]:
+        c.execute("DROP TRIGGER tickets_events_au")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tickets_events_au
+        AFTER UPDATE OF status, assigned_to, priority, category_id ON tickets
+    BEGIN
+        INSERT INTO ticket_events (event, ticket_id, ticket_number, status)
+        VALUES (
+            CASE WHEN NEW.status = 'closed' AND OLD.status IS NOT 'closed'
+                 THEN 'ticket_closed' ELSE 'ticket_updated' END,
+            NEW.id, NEW.ticket_number, NEW.status
+        );
+    END''')
+
+# =====================================================
+# VERSÕES DAS TABELAS (ETags)
+# =====================================================
+# Um contador por tabela, incrementado por trigger a cada escrita. As ETags
+# das APIs são derivadas desses números, sem hashear o corpo da resposta.
+VERSIONED_TABLES = ('tickets', 'categories', 'panels', 'config', 'ticket_rollups')
+
+# Contadores sem tabela por trás: só avisam os outros workers que um cache
+# em memória foi invalidado (ver invalidate_discord_cache)
+CACHE_VERSIONS = ('discord_channels', 'discord_roles', 'discord_guild')
+
+def _create_table_versions(conn):
+    """Cria a tabela de versões e os triggers de incremento"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    for table in VERSIONED_TABLES:
+        c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+        for action in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{action.lower()}
+                AFTER {action} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END''')
+    for name in CACHE_VERSIONS:
+        c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (name,))
+
+# =====================================================
+# ÍNDICE DE BUSCA (FTS5)
+# =====================================================
+# Tabela FTS5 de conteúdo externo: guarda só o índice invertido do texto das
+# mensagens e aponta para ticket_messages.id; triggers a mantêm em dia.
+SEARCH_AVAILABLE = False
+
+def _create_search_index(conn):
+    """Cria a tabela FTS5 e os triggers (sem FTS5 no SQLite, a busca fica desativada)"""
+    global SEARCH_AVAILABLE
+    c = conn.cursor()
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ticket_messages_fts'"
+    ).fetchone()
+    try:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS ticket_messages_fts USING fts5(
+            content,
+            content='ticket_messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ FTS5 indisponível, busca desativada: {e}")
+        return
+    
+    c.execute('''CREATE TRIGGER IF NOT EXISTS ticket_messages_fts_ai AFTER INSERT ON ticket_messages BEGIN
+        INSERT INTO ticket_messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS ticket_messages_fts_ad AFTER DELETE ON ticket_messages BEGIN
+        INSERT INTO ticket_messages_fts (ticket_messages_fts, rowid, content)
+        VALUES ('delete', OLD.id, OLD.content);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS ticket_messages_fts_au AFTER UPDATE OF content ON ticket_messages BEGIN
+        INSERT INTO ticket_messages_fts (ticket_messages_fts, rowid, content)
+        VALUES ('delete', OLD.id, OLD.content);
+        INSERT INTO ticket_messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+    END''')
+    
+    # Índice novo num banco que já tinha mensagens
+    if not exists:
+        rebuild_search_index(conn)
+    SEARCH_AVAILABLE = True
+
+def rebuild_search_index(conn):
+    """Reconstrói o índice FTS a partir de ticket_messages"""
+    conn.execute("INSERT INTO ticket_messages_fts (ticket_messages_fts) VALUES ('rebuild')")
+
+def read_ticket_counters(conn):
+    """Lê os contadores como {scope: {key: value}}"""
+    counters = {}
+    for scope, key, value in conn.execute("SELECT scope, key, value FROM ticket_counters"):
+        counters.setdefault(scope, {})[key] = value
+    return counters
+
+def format_duration(seconds):
+    """Formata uma duração em segundos como '18 min', '3h 05min' ou '2d 4h'"""
+    minutes = int(round(seconds / 60))
+    if minutes < 60:
+        return f"{minutes} min"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h {minutes:02d}min"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h"
+
+# =====================================================
+# CONSULTAS FREQUENTES
+# =====================================================
+# Paginação por cursor (keyset) sobre (created_at, id): cada página é uma
+# busca direta no índice idx_tickets_status_created, sem OFFSET.
+TICKETS_BY_STATUS_QUERY = """
+    SELECT t.*, c.name as category_name, c.emoji as category_emoji
+    FROM tickets t
+    LEFT JOIN categories c ON t.category_id = c.id
+    WHERE t.status = ?
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT ?
+"""
+
+TICKETS_BY_STATUS_AFTER_QUERY = """
+    SELECT t.*, c.name as category_name, c.emoji as category_emoji
+    FROM tickets t
+    LEFT JOIN categories c ON t.category_id = c.id
+    WHERE t.status = ? AND (t.created_at, t.id) < (?, ?)
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT ?
+"""
+
+# Tickets sem created_at (bancos antigos) ficam no fim da ordem e a comparação
+# de tupla com NULL nunca é verdadeira: são paginados só por id
+TICKETS_BY_STATUS_UNDATED_QUERY = """
+    SELECT t.*, c.name as category_name, c.emoji as category_emoji
+    FROM tickets t
+    LEFT JOIN categories c ON t.category_id = c.id
+    WHERE t.status = ? AND t.created_at IS NULL AND t.id < ?
+    ORDER BY t.id DESC
+    LIMIT ?
+"""
+
+# Tickets avulsos (o dashboard atualiza só as linhas que mudaram)
+TICKETS_BY_IDS_QUERY = """
+    SELECT t.*, c.name as category_name, c.emoji as category_emoji
+    FROM tickets t
+    LEFT JOIN categories c ON t.category_id = c.id
+    WHERE t.id IN ({ids})
+"""
+
+TICKETS_PAGE_SIZE = 50
+TICKETS_MAX_PAGE_SIZE = 200
+# Maior id possível no SQLite (início da paginação dos tickets sem data)
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+TICKET_DETAIL_QUERY = """
+    SELECT t.*, c.name as category_name, c.emoji as category_emoji
+    FROM tickets t
+    LEFT JOIN categories c ON t.category_id = c.id
+    WHERE t.id = ?
+"""
+
+TICKET_MESSAGES_QUERY = """
+    SELECT * FROM ticket_messages
+    WHERE ticket_id = ?
+    ORDER BY created_at ASC, id ASC
+"""
+
+# Páginas de mensagens: o cursor é o id de uma mensagem e a ordem é
+# (created_at, id), a mesma do índice idx_ticket_messages_ticket_created.
+TICKET_MESSAGES_LATEST_QUERY = """
+    SELECT * FROM ticket_messages
+    WHERE ticket_id = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+"""
+
+TICKET_MESSAGES_BEFORE_QUERY = """
+    SELECT * FROM ticket_messages
+    WHERE ticket_id = ?
+      AND (created_at, id) < (SELECT created_at, id FROM ticket_messages WHERE id = ?)
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+"""
+
+TICKET_MESSAGES_AFTER_QUERY = """
+    SELECT * FROM ticket_messages
+    WHERE ticket_id = ?
+      AND (created_at, id) > (SELECT created_at, id FROM ticket_messages WHERE id = ?)
+    ORDER BY created_at ASC, id ASC
+    LIMIT ?
+"""
+
+# Primeiro lote do streaming NDJSON (os seguintes usam TICKET_MESSAGES_AFTER_QUERY)
+TICKET_MESSAGES_FIRST_QUERY = """
+    SELECT * FROM ticket_messages
+    WHERE ticket_id = ?
+    ORDER BY created_at ASC, id ASC
+    LIMIT ?
+"""
+
+TICKET_EXISTS_QUERY = "SELECT 1 FROM tickets WHERE id = ?"
+
+MESSAGES_PAGE_SIZE = 100
+MESSAGES_MAX_PAGE_SIZE = 500
+MESSAGES_STREAM_BATCH = 500
+
+CATEGORIES_LIST_QUERY = "SELECT * FROM categories ORDER BY created_at DESC"
+
+PANELS_LIST_QUERY = "SELECT * FROM panels ORDER BY created_at DESC"
+
+CONFIG_VALUE_QUERY = "SELECT value FROM config WHERE key = ?"
+
+ANALYTICS_SERIES_QUERY = """
+    SELECT bucket, key, created, closed, messages,
+           resolution_seconds, resolution_p50, resolution_p90
+    FROM ticket_rollups
+    WHERE granularity = ? AND dimension = ? AND bucket BETWEEN ? AND ?
+    ORDER BY bucket, key
+"""
+
+# Consultas verificadas por `flask check-indexes` (nome -> (sql, parâmetros de exemplo))
+HOT_QUERIES = {
+    'get_tickets': (TICKETS_BY_STATUS_QUERY, ('open', TICKETS_PAGE_SIZE)),
+    'get_tickets.cursor': (TICKETS_BY_STATUS_AFTER_QUERY, ('open', '2025-01-01 00:00:00', 1, TICKETS_PAGE_SIZE)),
+    'get_tickets.undated': (TICKETS_BY_STATUS_UNDATED_QUERY, ('open', 1, TICKETS_PAGE_SIZE)),
+    'get_tickets.ids': (TICKETS_BY_IDS_QUERY.format(ids='?, ?'), (1, 2)),
+    'get_ticket': (TICKET_DETAIL_QUERY, (1,)),
+    'get_ticket.messages': (TICKET_MESSAGES_QUERY, (1,)),
+    'ticket_messages.latest': (TICKET_MESSAGES_LATEST_QUERY, (1, MESSAGES_PAGE_SIZE)),
+    'ticket_messages.before': (TICKET_MESSAGES_BEFORE_QUERY, (1, 1, MESSAGES_PAGE_SIZE)),
+    'ticket_messages.after': (TICKET_MESSAGES_AFTER_QUERY, (1, 1, MESSAGES_PAGE_SIZE)),
+    'ticket_messages.first': (TICKET_MESSAGES_FIRST_QUERY, (1, MESSAGES_STREAM_BATCH)),
+    'categories': (CATEGORIES_LIST_QUERY, ()),
+    'panels': (PANELS_LIST_QUERY, ()),
+    'load_welcome_config': (CONFIG_VALUE_QUERY, ('welcome_config',)),
+    'analytics': (ANALYTICS_SERIES_QUERY, ('day', 'all', '2025-01-01', '2025-12-31')),
+}
+
+def encode_cursor(*values):
+    """Codifica a posição de paginação como um token opaco para a URL"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token, types):
+    """Decodifica um token de encode_cursor; retorna None se for inválido
+    ou se os valores não forem dos tipos esperados (ex: (str, int))"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(types):
+        return None
+    # bool é subclasse de int no Python, mas true não é um id
+    if not all(isinstance(v, t) and not isinstance(v, bool) for v, t in zip(values, types)):
+        return None
+    return values
+
+def explain_query_plan(conn, sql, params=()):
+    """Retorna as linhas de EXPLAIN QUERY PLAN de uma consulta"""
+    # Cursor comum: o EXPLAIN não passa pela medição de consultas (ver PERFIL DE SQL)
+    cursor = conn.cursor(sqlite3.Cursor)
+    return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def check_query_plans(conn):
+    """Verifica se todas as HOT_QUERIES usam índice (sem SCAN nem ordenação temporária).
+
+    Retorna {nome: (ok, linhas_do_plano)}.
+    """
+    results = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = explain_query_plan(conn, sql, params)
+        ok = not any(
+            (step.startswith('SCAN') and 'USING' not in step) or 'TEMP B-TREE' in step
+            for step in plan
+        )
+        results[name] = (ok, plan)
+    return results
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Mostra o plano das consultas frequentes e falha se alguma não usar índice"""
+    with get_db() as conn:
+        results = check_query_plans(conn)
+    
+    failed = False
+    for name, (ok, plan) in results.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+        for step in plan:
+            print(f"     {step}")
+        failed = failed or not ok
+    
+    if failed:
+        raise SystemExit(1)
+
+# =====================================================
+# GET CONDICIONAL (ETag / 304)
+# =====================================================
+# As versões são lidas do banco no máximo uma vez a cada ETAG_VERSION_TTL
+# segundos por processo; a maioria dos polls vira uma comparação de
+# cabeçalho sem SQL nem JSON. Escritas feitas neste processo (qualquer
+# requisição que não seja GET) descartam o snapshot na hora.
+ETAG_VERSION_TTL = float(os.getenv('ETAG_VERSION_TTL', 1))
+
+_versions_lock = native_lock()
+_versions_snapshot = (0.0, {})
+
+def table_versions():
+    """Versões atuais das tabelas ({nome: versão}), com cache curto"""
+    loaded_at, versions = _versions_snapshot
+    if time.monotonic() - loaded_at < ETAG_VERSION_TTL:
+        return versions
+    # O lock é nativo: só é pego dentro do pool de run_blocking, nunca na greenlet
+    return run_blocking(_reload_table_versions)
+
+def _reload_table_versions():
+    global _versions_snapshot
+    with _versions_lock:
+        loaded_at, versions = _versions_snapshot
+        if time.monotonic() - loaded_at < ETAG_VERSION_TTL:
+            return versions
+        with get_db() as conn:
+            versions = dict(conn.execute("SELECT name, version FROM table_versions").fetchall())
+        _versions_snapshot = (time.monotonic(), versions)
+        return versions
+
+def invalidate_table_versions():
+    global _versions_snapshot
+    _versions_snapshot = (0.0, {})
+
+@app.after_request
+def _invalidate_versions_after_write(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        invalidate_table_versions()
+    return response
+
+def versioned(*tables, max_age=0):
+    """Adiciona ETag derivada das versões de `tables` e responde 304 se não mudou
+
+    A ETag também inclui a query string (status, cursor, etc.). `max_age`
+    permite ao navegador reutilizar a resposta sem perguntar ao servidor.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            
+            versions = table_versions()
+            key = '|'.join(f"{t}:{versions.get(t, 0)}" for t in tables)
+            key += '|' + request.full_path
+            etag = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+            cache_control = f'private, max-age={max_age}' if max_age else 'private, no-cache'
+            
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return decorated_function
+    return decorator
+
+# =====================================================
+# MÉTRICAS (/metrics, formato Prometheus)
+# =====================================================
+# Tempo por rota (hooks before/after_request), por consulta SQL (cursores
+# medidos do database.py) e por rota da API do Discord, incluindo retries e
+# esperas de rate limit. A soma de http_request_duration_seconds por rota é
+# o tempo de worker que cada endpoint consome.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+metrics = Registry()
+http_duration = metrics.histogram(
+    'http_request_duration_seconds', 'Tempo de resposta por rota', ('method', 'route', 'status'))
+db_duration = metrics.histogram(
+    'db_query_duration_seconds', 'Tempo de execução por consulta SQL', ('statement',), buckets=DB_BUCKETS)
+discord_duration = metrics.histogram(
+    'discord_request_duration_seconds', 'Chamadas à API do Discord por rota (com retries e esperas)',
+    ('route', 'status'))
+discord_ratelimit_wait = metrics.counter(
+    'discord_ratelimit_wait_seconds_total', 'Tempo parado esperando o rate limit do Discord', ('route',))
+
+def _observe_discord(route, status, seconds, waited):
+    discord_duration.observe(seconds, route, str(status))
+    if waited:
+        discord_ratelimit_wait.inc(waited, route)
+
+discord_api.observer = _observe_discord
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        http_duration.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+        metrics.maybe_flush()
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métricas somadas de todos os workers (Authorization: Bearer <METRICS_TOKEN>)"""
+    if not METRICS_TOKEN:
+        return jsonify({'error': 'Métricas não configuradas (METRICS_TOKEN)'}), 503
+    
+    auth = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth.encode(), f'Bearer {METRICS_TOKEN}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# =====================================================
+# PERFIL DE SQL E CONSULTAS LENTAS
+# =====================================================
+# Consultas acima de SLOW_QUERY_MS vão para o log com a rota, o formato dos
+# parâmetros (só os tipos, nunca os valores) e o EXPLAIN QUERY PLAN. Com
+# SQL_PROFILE=True toda requisição tem as consultas listadas no log; um staff
+# pode perfilar só as suas com o cabeçalho `X-SQL-Profile: 1` (ou o cookie
+# sql_profile=1) e recebe o resumo também em Server-Timing (DevTools).
+# Escritas dos webhooks rodam na thread da WriteQueue e aparecem no log de
+# consultas lentas como "segundo plano"; threads que carregam dados de uma
+# requisição (seções da página) recebem uma cópia do contexto dela.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+SQL_PROFILE = os.getenv('SQL_PROFILE', 'False') == 'True'
+SERVER_TIMING_MAX_QUERIES = 20
+EXPLAINABLE_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_sql_profile = contextvars.ContextVar('sql_profile', default=None)
+
+def _parameter_shape(parameters):
+    if parameters is None:
+        return None     # executemany
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+def _profiled_plan(conn, sql, parameters):
+    if parameters is None or not sql.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+        return None
+    try:
+        return explain_query_plan(conn, sql, parameters)
+    except sqlite3.Error:
+        return None
+
+def _observe_query(conn, sql, parameters, seconds):
+    db_duration.observe(seconds, statement_label(sql))
+    
+    profile = _sql_profile.get()
+    slow = SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS
+    if profile is None and not slow:
+        return
+    
+    entry = {
+        'sql': statement_label(sql),
+        'ms': seconds * 1000,
+        'params': _parameter_shape(parameters),
+        'plan': _profiled_plan(conn, sql, parameters),
+    }
+    if profile is not None:
+        profile.append(entry)
+    if slow:
+        where = f"{request.method} {request.path}" if has_request_context() else 'segundo plano'
+        print(f"🐢 SQL lenta ({entry['ms']:.1f}ms) em {where}: {entry['sql']} "
+              f"| parâmetros: {entry['params']} | plano: {entry['plan']}")
+
+def _profile_requested():
+    flag = request.headers.get('X-SQL-Profile') or request.cookies.get('sql_profile')
+    return flag == '1' and is_staff_session()
+
+def _server_timing_desc(text):
+    text = text[:100].replace('\\', '').replace('"', "'")
+    return text.encode('ascii', 'replace').decode()
+
+@app.before_request
+def _start_sql_profile():
+    if SQL_PROFILE or _profile_requested():
+        g.sql_profile_token = _sql_profile.set([])
+
+@app.after_request
+def _finish_sql_profile(response):
+    profile = _sql_profile.get()
+    if profile is None:
+        return response
+    
+    total_ms = sum(entry['ms'] for entry in profile)
+    print(f"🔬 Perfil SQL {request.method} {request.full_path.rstrip('?')}: "
+          f"{len(profile)} consultas, {total_ms:.1f}ms")
+    for entry in profile:
+        print(f"   {entry['ms']:8.2f}ms  {entry['sql']}  parâmetros={entry['params']}  plano={entry['plan']}")
+    
+    if _profile_requested():
+        timings = [f'db;dur={total_ms:.2f};desc="{len(profile)} consultas SQL"']
+        started = g.get('request_started')
+        if started is not None:
+            timings.append(f'total;dur={(time.perf_counter() - started) * 1000:.2f}')
+        slowest = sorted(enumerate(profile, 1), key=lambda item: item[1]['ms'], reverse=True)
+        for position, entry in slowest[:SERVER_TIMING_MAX_QUERIES]:
+            timings.append(f'sql{position};dur={entry["ms"]:.2f};desc="{_server_timing_desc(entry["sql"])}"')
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+@app.teardown_request
+def _reset_sql_profile(exc):
+    token = g.pop('sql_profile_token', None)
+    if token is not None:
+        _sql_profile.reset(token)
 
 # =====================================================
 # DECORADORES DE AUTENTICAÇÃO
@@ -139,6 +878,10 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def is_staff_session():
+    """True se o usuário logado é staff (decidido no login, revalidado em segundo plano)"""
+    return session.get('staff') is True
+
 def staff_required(f):
     """Requer que o usuário seja staff"""
     @wraps(f)
@@ -146,8 +889,7 @@ def staff_required(f):
         if 'user' not in session:
             return redirect(url_for('login'))
         
-        user_roles = session.get('user', {}).get('roles', [])
-        if not any(role in ALLOWED_ROLES for role in user_roles):
+        if not is_staff_session():
             return jsonify({'error': 'Acesso negado - Apenas staff'}), 403
         
         return f(*args, **kwargs)
@@ -188,8 +930,16 @@ def callback():
         'redirect_uri': DISCORD_REDIRECT_URI
     }
     
+    timings = {}
+    started = time.perf_counter()
+    
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    r = requests.post(TOKEN_URL, data=data, headers=headers)
+    try:
+        r = discord_api.post('/oauth2/token', data=data, headers=headers, token_type=None)
+    except DiscordAPIError as e:
+        return f"Erro ao obter token: {e}", 502
+    finally:
+        timings['token'] = time.perf_counter() - started
     
     if r.status_code != 200:
         return f"Erro ao obter token: {r.text}", 400
@@ -197,9 +947,28 @@ def callback():
     token_data = r.json()
     access_token = token_data['access_token']
     
+    def timed(step, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[step] = time.perf_counter() - t0
+    
+    # Usuário, cargos no servidor e dono do servidor (em cache) em paralelo
+    user_future = discord_executor.submit(
+        timed, 'user', discord_api.get, '/users/@me', token=access_token, token_type='Bearer'
+    )
+    member_future = discord_executor.submit(
+        timed, 'member', discord_api.get, f'/users/@me/guilds/{GUILD_ID}/member',
+        token=access_token, token_type='Bearer'
+    )
+    guild_future = discord_executor.submit(timed, 'guild', get_guild)
+    
     # Obter informações do usuário
-    headers = {'Authorization': f"Bearer {access_token}"}
-    user_response = requests.get(f'{DISCORD_API_URL}/users/@me', headers=headers)
+    try:
+        user_response = user_future.result()
+    except DiscordAPIError:
+        return "Erro ao obter dados do usuário", 502
     
     if user_response.status_code != 200:
         return "Erro ao obter dados do usuário", 400
@@ -207,10 +976,10 @@ def callback():
     user_data = user_response.json()
     
     # Obter cargos do usuário no servidor
-    guild_response = requests.get(
-        f'{DISCORD_API_URL}/users/@me/guilds/{GUILD_ID}/member',
-        headers={'Authorization': f"Bearer {access_token}"}
-    )
+    try:
+        guild_response = member_future.result()
+    except DiscordAPIError:
+        return "Erro ao obter cargos do usuário", 502
     
     # Obter cargos do usuário
     user_roles = []
@@ -226,26 +995,21 @@ def callback():
         print(f"🔍 DEBUG - User Roles: {user_roles}")
         print(f"🔍 DEBUG - Allowed Roles: {ALLOWED_ROLES}")
     
-    # Verificar se é o dono do servidor através do endpoint de guild
+    # Verificar se é o dono do servidor (dados do servidor vêm do cache)
     try:
-        guild_info = requests.get(
-            f'{DISCORD_API_URL}/guilds/{GUILD_ID}',
-            headers={'Authorization': f"Bot {DISCORD_BOT_TOKEN}"}
-        )
+        guild_data = guild_future.result()
+        owner_id = str(guild_data.get('owner_id'))
+        user_id = str(user_data['id'])
+        is_owner = (owner_id == user_id)
         
-        if guild_info.status_code == 200:
-            guild_data = guild_info.json()
-            owner_id = str(guild_data.get('owner_id'))
-            user_id = str(user_data['id'])
-            is_owner = (owner_id == user_id)
-            
-            print(f"🔍 DEBUG - Server Owner ID: {owner_id}")
-            print(f"🔍 DEBUG - Is Owner: {is_owner}")
-        else:
-            print(f"❌ DEBUG - Failed to get guild info: {guild_info.status_code}")
+        print(f"🔍 DEBUG - Server Owner ID: {owner_id}")
+        print(f"🔍 DEBUG - Is Owner: {is_owner}")
     except Exception as e:
         print(f"❌ DEBUG - Error checking owner: {e}")
     
+    timings['total'] = time.perf_counter() - started
+    print("⏱️ Login: " + " | ".join(f"{step}={seconds * 1000:.0f}ms" for step, seconds in timings.items()))
+    
     # Verificar se tem permissão (Owner OU Staff)
     has_staff_role = any(role in ALLOWED_ROLES for role in user_roles)
     has_permission = is_owner or has_staff_role
@@ -259,7 +1023,8 @@ def callback():
             details=f"Você não tem permissão para acessar o dashboard. Apenas Staff e superiores podem acessar.<br><br>Debug Info:<br>User ID: {user_data['id']}<br>Roles: {user_roles}<br>Is Owner: {is_owner}"
         )
     
-    # Salvar na sessão
+    # Salvar na sessão (id novo a cada login)
+    session.regenerate()
     session['user'] = {
         'id': user_data['id'],
         'username': user_data['username'],
@@ -267,9 +1032,83 @@ def callback():
         'avatar': user_data.get('avatar'),
         'roles': user_roles
     }
+    session['staff'] = has_permission
     
     return redirect(url_for('dashboard'))
 
+# =====================================================
+# REVALIDAÇÃO DAS SESSÕES
+# =====================================================
+# A permissão de staff é decidida no login e fica na sessão; o
+# staff_required só lê session['staff']. A cada SESSION_REVALIDATE_MINUTES
+# um job confere no Discord os cargos de quem tem sessão aberta: quem perdeu
+# o cargo perde o acesso e quem saiu do servidor é deslogado.
+SESSION_REVALIDATE_MINUTES = float(os.getenv('SESSION_REVALIDATE_MINUTES', 15))
+DISCORD_UNKNOWN_MEMBER = 10007
+
+def _discord_error_code(response):
+    try:
+        return response.json().get('code')
+    except ValueError:
+        return None
+
+def revalidate_sessions():
+    """Confere cargos/dono das sessões não verificadas há um intervalo"""
+    due = session_store.due_for_validation(time.time() - SESSION_REVALIDATE_MINUTES * 60)
+    result = {'users': 0, 'revoked': 0, 'logged_out': 0}
+    if not due:
+        return result
+    
+    try:
+        owner_id = str(get_guild().get('owner_id'))
+    except DiscordAPIError:
+        owner_id = None
+    
+    for user_id, sids in due.items():
+        try:
+            response = discord_api.get(f'/guilds/{GUILD_ID}/members/{user_id}')
+        except DiscordAPIError as e:
+            print(f"⚠️ Revalidação da sessão de {user_id} adiada: {e}")
+            continue
+        
+        if response.status_code == 404 and _discord_error_code(response) == DISCORD_UNKNOWN_MEMBER:
+            session_store.delete(*sids)
+            result['logged_out'] += len(sids)
+            continue
+        if response.status_code != 200:
+            continue
+        
+        roles = [int(role) for role in response.json().get('roles', [])]
+        staff = user_id == owner_id or any(role in ALLOWED_ROLES for role in roles)
+        if not staff and owner_id is None:
+            continue    # sem saber o dono, não dá para negar; tenta na próxima
+        
+        def update(data):
+            data['user']['roles'] = roles
+            data['staff'] = staff
+        session_store.revalidate(sids, update)
+        result['users'] += 1
+        if not staff:
+            result['revoked'] += len(sids)
+    
+    if result['revoked'] or result['logged_out']:
+        print(f"🔐 Sessões revalidadas: {result['revoked']} sem permissão, {result['logged_out']} deslogadas")
+    return result
+
+def _job_revalidate_sessions(payload):
+    """Job periódico: revalida, apaga sessões expiradas e agenda a próxima execução"""
+    try:
+        result = revalidate_sessions()
+        result['pruned'] = session_store.prune()
+    finally:
+        schedule_session_job()
+    return result
+
+def schedule_session_job():
+    if SESSION_REVALIDATE_MINUTES > 0:
+        job_queue.schedule_unique('revalidate_sessions', {}, delay=SESSION_REVALIDATE_MINUTES * 60,
+                                  max_attempts=1)
+
 # =====================================================
 # ROTAS DO DASHBOARD
 # =====================================================
@@ -283,31 +1122,213 @@ def logout():
 @staff_required
 def dashboard():
     """Dashboard principal"""
-    return render_template('dashboard.html', user=session['user'])
+    return render_template('dashboard.html', user=session['user'],
+                           initial_state=load_page_state('dashboard'))
+
+# =====================================================
+# ESTADO INICIAL DAS PÁGINAS
+# =====================================================
+# As páginas saem do servidor já com os dados da primeira tela embutidos
+# (<script type="application/json" id="initialState">), carregados em
+# paralelo e das mesmas fontes em cache das APIs. O navegador só volta a
+# buscar o que mudar depois. Uma seção que falhar (ex: Discord fora do ar)
+# vai como null e a página a busca pela API, como antes.
+#
+# /api/bootstrap entrega as mesmas seções numa única requisição, cada uma
+# com sua própria versão: o cliente informa as versões que já tem e só
+# recebe as seções que mudaram.
+PAGE_SECTIONS = {
+    'dashboard': ('stats', 'tickets'),
+    'categories': ('categories', 'discord_categories', 'discord_roles'),
+    'panels': ('panels', 'categories'),
+}
+
+SECTION_LOADERS = {
+    'stats': lambda: load_stats(),
+    'tickets': lambda: list_tickets('open'),
+    'categories': lambda: list_categories(),
+    'panels': lambda: list_panels(),
+    'discord_channels': lambda: list_text_channels(),
+    'discord_categories': lambda: list_discord_categories(),
+    'discord_roles': lambda: list_staff_roles(),
+}
+
+# Tabelas de que cada seção depende (None = dados do Discord, versão pelo conteúdo)
+SECTION_TABLES = {
+    'stats': ('tickets',),
+    'tickets': ('tickets', 'categories'),
+    'categories': ('categories',),
+    'panels': ('panels',),
+    'discord_channels': None,
+    'discord_categories': None,
+    'discord_roles': None,
+}
+
+# Tempo máximo que a página espera pelas seções (ex: Discord lento)
+PAGE_STATE_TIMEOUT = float(os.getenv('PAGE_STATE_TIMEOUT', 2))
+
+# Pool próprio: um loader que estourou o tempo continua rodando, e com o
+# Discord lento isso não pode ocupar as threads dos logins (discord_executor).
+# Pool cheio só faz as seções virem null e a página buscá-las pela API.
+section_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PAGE_STATE_WORKERS', 4)), thread_name_prefix='page-state'
+)
+
+# Última versão carregada de cada seção do banco neste processo: (versão, dados)
+_section_cache = {}
+
+def load_section(name):
+    """(versão, dados) de uma seção
+
+    Seções do banco são reaproveitadas enquanto as tabelas de que dependem
+    não mudarem (mesmas versões das ETags).
+    """
+    tables = SECTION_TABLES[name]
+    if tables is None:
+        data = SECTION_LOADERS[name]()
+        raw = json.dumps(data, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(raw, digest_size=8).hexdigest(), data
+    
+    versions = table_versions()
+    version = '.'.join(str(versions.get(table, 0)) for table in tables)
+    cached = _section_cache.get(name)
+    if cached is not None and cached[0] == version:
+        return cached
+    cached = _section_cache[name] = (version, run_blocking(SECTION_LOADERS[name]))
+    return cached
+
+def load_sections(names, timeout=PAGE_STATE_TIMEOUT):
+    """Carrega as seções em paralelo; retorna ({nome: dados ou None}, {nome: versão ou None})"""
+    # Cada loader roda com uma cópia do contexto da requisição (como o
+    # run_blocking), então o perfil de SQL e o log de lentas veem a rota
+    futures = {
+        name: section_executor.submit(contextvars.copy_context().run, load_section, name)
+        for name in names
+    }
+    deadline = time.monotonic() + timeout
+    sections, versions = {}, {}
+    for name, future in futures.items():
+        try:
+            versions[name], sections[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"⚠️ Seção '{name}' falhou: {e!r}")
+            versions[name], sections[name] = None, None
+    return sections, versions
+
+def load_page_state(page):
+    return load_sections(PAGE_SECTIONS[page])[0]
+
+@app.route('/api/bootstrap')
+@staff_required
+def bootstrap():
+    """Todas as seções de uma página numa resposta só
+
+    Parâmetros: page (dashboard | categories | panels) ou sections (nomes
+    separados por vírgula) e known (nome:versão,... que o cliente já tem).
+    Seções com a mesma versão vêm listadas em `unchanged`, sem dados; uma
+    seção que falhou vem com dados e versão null.
+    """
+    page = request.args.get('page')
+    if page:
+        if page not in PAGE_SECTIONS:
+            return jsonify({'error': 'Página inválida'}), 400
+        names = PAGE_SECTIONS[page]
+    else:
+        # Sem repetições, na ordem pedida (?sections=stats,stats)
+        names = list(dict.fromkeys(name for name in request.args.get('sections', '').split(',') if name))
+        if not names or any(name not in SECTION_LOADERS for name in names):
+            return jsonify({'error': 'Informe page ou sections válidas'}), 400
+    
+    known = dict(item.split(':', 1) for item in request.args.get('known', '').split(',') if ':' in item)
+    sections, versions = load_sections(names)
+    unchanged = [name for name in names if versions[name] is not None and known.get(name) == versions[name]]
+    for name in unchanged:
+        del sections[name]
+    
+    response = jsonify({'sections': sections, 'versions': versions, 'unchanged': unchanged})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # =====================================================
 # APIs PARA DROPDOWNS (Buscar dados do Discord)
 # =====================================================
+# Canais e cargos do servidor mudam pouco: ficam num cache compartilhado
+# (TTL + stale-while-revalidate) para que uma visita às páginas de
+# categorias/painéis não custe várias chamadas idênticas à API do Discord.
+DISCORD_CACHE_TTL = int(os.getenv('DISCORD_CACHE_TTL', 300))
+DISCORD_CACHE_STALE_TTL = int(os.getenv('DISCORD_CACHE_STALE_TTL', 3600))
+
+guild_cache = TTLCache(ttl=DISCORD_CACHE_TTL, stale_ttl=DISCORD_CACHE_STALE_TTL)
+
+# Versão de cada recurso vista por este processo (ver CACHE_VERSIONS)
+_guild_cache_versions = {}
+
+def _guild_cached(key, loader):
+    """guild_cache.get, descartando antes a entrada que outro worker invalidou"""
+    version = table_versions().get(f'discord_{key}', 0)
+    if _guild_cache_versions.get(key) != version:
+        guild_cache.invalidate(key)
+        _guild_cache_versions[key] = version
+    return guild_cache.get(key, loader)
+
+# IDs dos cargos de staff (só esses podem ver tickets)
+STAFF_ROLE_IDS = [
+    '1365636960651051069',  # 🔥 Founder [FND]
+    '1365636456386789437',  # 🌟 Sub Dono [SDN]
+    '1365633918593794079',  # 👑 Administrador [ADM]
+    '1365634226254254150',  # 🛠️ Staff [STF]
+    '1365633102973763595',  # ⚔️ Moderador [MOD]
+    '1365631940434333748',  # 🛡️ Sub Moderador [SBM]
+]
+
+def _fetch_guild_resource(resource):
+    return discord_api.get_json(f'/guilds/{GUILD_ID}/{resource}')
+
+def get_guild_channels():
+    """Todos os canais do servidor (uma única chamada em cache para canais e categorias)"""
+    return _guild_cached('channels', lambda: _fetch_guild_resource('channels'))
+
+def get_guild():
+    """Dados do servidor (owner_id etc.), em cache"""
+    return _guild_cached('guild', lambda: discord_api.get_json(f'/guilds/{GUILD_ID}'))
+
+def get_guild_roles():
+    """Todos os cargos do servidor (em cache)"""
+    return _guild_cached('roles', lambda: _fetch_guild_resource('roles'))
+
+def list_text_channels():
+    """Canais de texto e de anúncios do servidor"""
+    return [
+        {'id': ch['id'], 'name': ch['name'], 'type': ch['type']}
+        for ch in get_guild_channels()
+        if ch['type'] in [0, 5]  # 0 = text, 5 = announcement
+    ]
+
+def list_discord_categories():
+    """Categorias de canais do servidor"""
+    return [
+        {'id': ch['id'], 'name': ch['name']}
+        for ch in get_guild_channels()
+        if ch['type'] == 4  # 4 = category
+    ]
+
+def list_staff_roles():
+    """APENAS os cargos de staff, na ordem da hierarquia (mesma ordem de STAFF_ROLE_IDS)"""
+    staff_roles = [
+        {'id': r['id'], 'name': r['name'], 'color': r.get('color', 0)}
+        for r in get_guild_roles()
+        if r['id'] in STAFF_ROLE_IDS
+    ]
+    staff_roles.sort(key=lambda r: STAFF_ROLE_IDS.index(r['id']))
+    return staff_roles
+
 @app.route('/api/discord/channels')
 @staff_required
 def get_discord_channels():
     """Busca todos os canais do servidor"""
     try:
-        response = requests.get(
-            f'{DISCORD_API_URL}/guilds/{GUILD_ID}/channels',
-            headers={'Authorization': f"Bot {DISCORD_BOT_TOKEN}"}
-        )
-        
-        if response.status_code == 200:
-            channels = response.json()
-            # Filtrar apenas canais de texto
-            text_channels = [
-                {'id': ch['id'], 'name': ch['name'], 'type': ch['type']}
-                for ch in channels
-                if ch['type'] in [0, 5]  # 0 = text, 5 = announcement
-            ]
-            return jsonify(text_channels)
-        
+        return jsonify(list_text_channels())
+    except DiscordAPIError:
         return jsonify({'error': 'Erro ao buscar canais'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -317,21 +1338,8 @@ def get_discord_channels():
 def get_discord_categories():
     """Busca todas as categorias do servidor"""
     try:
-        response = requests.get(
-            f'{DISCORD_API_URL}/guilds/{GUILD_ID}/channels',
-            headers={'Authorization': f"Bot {DISCORD_BOT_TOKEN}"}
-        )
-        
-        if response.status_code == 200:
-            channels = response.json()
-            # Filtrar apenas categorias
-            categories = [
-                {'id': ch['id'], 'name': ch['name']}
-                for ch in channels
-                if ch['type'] == 4  # 4 = category
-            ]
-            return jsonify(categories)
-        
+        return jsonify(list_discord_categories())
+    except DiscordAPIError:
         return jsonify({'error': 'Erro ao buscar categorias'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -340,136 +1348,1312 @@ def get_discord_categories():
 @staff_required
 def get_discord_roles():
     """Busca APENAS os cargos de STAFF (moderação)"""
-    # IDs dos cargos de staff (só esses podem ver tickets)
-    STAFF_ROLE_IDS = [
-        '1365636960651051069',  # 🔥 Founder [FND]
-        '1365636456386789437',  # 🌟 Sub Dono [SDN]
-        '1365633918593794079',  # 👑 Administrador [ADM]
-        '1365634226254254150',  # 🛠️ Staff [STF]
-        '1365633102973763595',  # ⚔️ Moderador [MOD]
-        '1365631940434333748',  # 🛡️ Sub Moderador [SBM]
-    ]
-    
     try:
-        response = requests.get(
-            f'{DISCORD_API_URL}/guilds/{GUILD_ID}/roles',
-            headers={'Authorization': f"Bot {DISCORD_BOT_TOKEN}"}
-        )
-        
-        if response.status_code == 200:
-            roles = response.json()
-            # Filtrar APENAS os cargos de staff
-            staff_roles = [
-                {'id': r['id'], 'name': r['name'], 'color': r.get('color', 0)}
-                for r in roles
-                if r['id'] in STAFF_ROLE_IDS
-            ]
-            # Ordenar na ordem da hierarquia (mesma ordem do array STAFF_ROLE_IDS)
-            staff_roles.sort(key=lambda r: STAFF_ROLE_IDS.index(r['id']))
-            return jsonify(staff_roles)
-        
+        return jsonify(list_staff_roles())
+    except DiscordAPIError:
         return jsonify({'error': 'Erro ao buscar cargos'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _bump_cache_versions(names):
+    with get_db() as conn:
+        conn.executemany(
+            "UPDATE table_versions SET version = version + 1 WHERE name = ?", [(name,) for name in names]
+        )
+        conn.commit()
+
+@app.route('/api/discord/cache/invalidate', methods=['POST'])
+@staff_required
+def invalidate_discord_cache():
+    """Descarta o cache de canais/cargos (ex: depois de criar um canal no Discord)
+
+    Corpo opcional: {"resource": "channels" | "roles" | "guild"}; sem corpo limpa tudo.
+    Vale para todos os workers: os outros veem o contador em table_versions
+    mudar (em até ETAG_VERSION_TTL) e descartam a cópia deles.
+    """
+    resource = (request.get_json(silent=True) or {}).get('resource')
+    if resource not in (None, 'channels', 'roles', 'guild'):
+        return jsonify({'success': False, 'message': 'Recurso inválido'}), 400
+    
+    names = [f'discord_{resource}'] if resource else list(CACHE_VERSIONS)
+    run_blocking(_bump_cache_versions, names)
+    guild_cache.invalidate(resource)
+    return jsonify({'success': True, 'message': 'Cache do Discord limpo!'})
+
 @app.route('/api/stats')
 @staff_required
+@versioned('tickets')
 def get_stats():
-    """Retorna estatísticas dos tickets"""
-    conn = sqlite3.connect('tickets.db')
-    c = conn.cursor()
-    
-    # Total de tickets
-    c.execute("SELECT COUNT(*) FROM tickets")
-    total = c.fetchone()[0]
-    
-    # Tickets abertos
-    c.execute("SELECT COUNT(*) FROM tickets WHERE status='open'")
-    open_tickets = c.fetchone()[0]
+    """Retorna estatísticas dos tickets (lidas da tabela de contadores)"""
+    return jsonify(load_stats())
+
+def load_stats():
+    with get_db() as conn:
+        return compute_stats(conn)
+
+def compute_stats(conn):
+    """Monta o payload de /api/stats a partir de ticket_counters"""
+    counters = read_ticket_counters(conn)
     
-    # Tickets fechados
-    c.execute("SELECT COUNT(*) FROM tickets WHERE status='closed'")
-    closed_tickets = c.fetchone()[0]
+    by_status = counters.get('status', {})
+    total = int(counters.get('total', {}).get('', 0))
+    open_tickets = int(by_status.get('open', 0))
+    closed_tickets = int(by_status.get('closed', 0))
+    waiting = int(counters.get('waiting', {}).get('', 0))
     
-    # Tempo médio de resposta (simulado - implementar lógica real)
-    avg_response_time = "18 min"
+    # Tempo médio até o fechamento
+    resolution = counters.get('resolution', {})
+    resolved = resolution.get('count', 0)
+    avg_response_time = format_duration(resolution.get('seconds', 0) / resolved) if resolved else "-"
     
     # Taxa de resolução
     resolution_rate = f"{int((closed_tickets / total * 100) if total > 0 else 0)}%"
     
-    conn.close()
-    
-    return jsonify({
+    return {
         'total': total,
         'open': open_tickets,
-        'waiting': 0,  # Implementar lógica
+        'waiting': waiting,
         'closed': closed_tickets,
         'avg_time': avg_response_time,
-        'resolution_rate': resolution_rate
-    })
+        'resolution_rate': resolution_rate,
+        'by_status': {k: int(v) for k, v in by_status.items() if v},
+        'by_category': {k: int(v) for k, v in counters.get('category', {}).items() if v},
+        'by_priority': {k: int(v) for k, v in counters.get('priority', {}).items() if v}
+    }
 
-@app.route('/api/tickets')
-@staff_required
-def get_tickets():
-    """Retorna lista de tickets"""
-    conn = sqlite3.connect('tickets.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    status_filter = request.args.get('status', 'open')
-    
-    query = """
-        SELECT t.*, c.name as category_name, c.emoji as category_emoji
-        FROM tickets t
-        LEFT JOIN categories c ON t.category_id = c.id
-        WHERE t.status = ?
-        ORDER BY t.created_at DESC
-        LIMIT 50
-    """
-    
-    c.execute(query, (status_filter,))
-    tickets = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
-    
-    return jsonify(tickets)
+# =====================================================
+# EVENTOS EM TEMPO REAL (Server-Sent Events)
+# =====================================================
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 1))
+EVENTS_HEARTBEAT = 15           # segundos entre comentários keep-alive
+EVENTS_STREAM_MAX_SECONDS = 300 # o navegador reconecta sozinho depois disso
+EVENTS_RETENTION = '-1 hour'    # quanto do log de eventos manter
+EVENTS_PRUNE_INTERVAL = 600     # segundos entre limpezas do log (job)
+EVENTS_REPLAY_LIMIT = 500
 
-@app.route('/api/ticket/<int:ticket_id>')
-@staff_required
-def get_ticket(ticket_id):
-    """Retorna detalhes de um ticket específico"""
-    conn = sqlite3.connect('tickets.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+NEW_TICKET_EVENTS_QUERY = """
+    SELECT id, event, ticket_id, ticket_number, status
+    FROM ticket_events
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+event_bus = EventBus()
+_event_watcher_lock = threading.Lock()
+_event_watcher = None
+
+def _event_payload(row):
+    return {
+        'ticket_id': row['ticket_id'],
+        'ticket_number': row['ticket_number'],
+        'status': row['status']
+    }
+
+def read_ticket_events(after_id):
+    """(eventos depois de `after_id`, stats atuais ou None se não houver eventos)"""
+    with get_db() as conn:
+        rows = conn.execute(NEW_TICKET_EVENTS_QUERY, (after_id, EVENTS_REPLAY_LIMIT)).fetchall()
+        return rows, compute_stats(conn) if rows else None
+
+def _last_ticket_event_id():
+    with get_db() as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM ticket_events").fetchone()[0]
+
+def _watch_ticket_events():
+    """Thread do worker: lê novos eventos do banco e publica no event_bus"""
+    last_id = run_blocking(_last_ticket_event_id)
     
-    # Buscar ticket
-    c.execute("""
-        SELECT t.*, c.name as category_name, c.emoji as category_emoji
-        FROM tickets t
-        LEFT JOIN categories c ON t.category_id = c.id
-        WHERE t.id = ?
-    """, (ticket_id,))
+    while True:
+        time.sleep(EVENTS_POLL_INTERVAL)
+        if not event_bus.subscriber_count:
+            # Sem ninguém ouvindo, só acompanha o fim do log: o primeiro
+            # dashboard a conectar não recebe eventos velhos (MAX(id) é O(1))
+            try:
+                last_id = run_blocking(_last_ticket_event_id)
+            except Exception as e:
+                print(f"❌ Erro ao ler eventos de tickets: {e}")
+            continue
+        
+        try:
+            rows, stats = run_blocking(read_ticket_events, last_id)
+        except Exception as e:
+            print(f"❌ Erro ao ler eventos de tickets: {e}")
+            continue
+        if not rows:
+            continue
+        
+        for row in rows:
+            event_bus.publish(row['event'], _event_payload(row), event_id=row['id'])
+        last_id = rows[-1]['id']
+        event_bus.publish('stats', stats, event_id=last_id)
+
+def prune_ticket_events():
+    """Apaga os eventos mais antigos que EVENTS_RETENTION; retorna quantos"""
+    with get_db() as conn:
+        deleted = conn.execute(
+            "DELETE FROM ticket_events WHERE created_at < datetime('now', ?)", (EVENTS_RETENTION,)
+        ).rowcount
+        conn.commit()
+    return deleted
+
+def _job_prune_events(payload):
+    """Job periódico: limpa o log de eventos (com ou sem dashboards abertos)"""
+    try:
+        deleted = prune_ticket_events()
+    finally:
+        schedule_events_job()
+    return {'deleted': deleted}
+
+def schedule_events_job():
+    job_queue.schedule_unique('prune_events', {}, delay=EVENTS_PRUNE_INTERVAL, max_attempts=1)
+
+def ensure_event_watcher():
+    """Inicia (uma vez por processo) a thread que alimenta o event_bus"""
+    global _event_watcher
+    with _event_watcher_lock:
+        if _event_watcher is None or not _event_watcher.is_alive():
+            _event_watcher = threading.Thread(target=_watch_ticket_events, daemon=True)
+            _event_watcher.start()
+
+@app.route('/api/events')
+@staff_required
+def events_stream():
+    """Stream SSE com ticket_created / ticket_updated / ticket_closed e stats
+
+    Reenvia os eventos perdidos desde o Last-Event-ID ao reconectar.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    ensure_event_watcher()
+    subscription = event_bus.subscribe()
+    
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            
+            if last_event_id is not None:
+                missed, stats = run_blocking(read_ticket_events, last_event_id)
+                for row in missed:
+                    yield format_sse(row['id'], row['event'], _event_payload(row))
+                if stats is not None:
+                    yield format_sse(missed[-1]['id'], 'stats', stats)
+            
+            deadline = time.monotonic() + EVENTS_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    item = subscription.get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield format_sse(*item)
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/tickets')
+@staff_required
+@versioned('tickets', 'categories')
+def get_tickets():
+    """Retorna uma página de tickets (paginação por cursor)
+
+    Parâmetros: status, limit (padrão 50, máx. 200) e cursor (o next_cursor
+    da página anterior). Resposta: {'tickets': [...], 'next_cursor': str|None}
+    Com ids=1,2,3 (máx. 200) retorna só esses tickets, de qualquer status.
+    """
+    if 'ids' in request.args:
+        try:
+            ids = [int(value) for value in request.args['ids'].split(',')]
+        except ValueError:
+            return jsonify({'error': 'ids deve ser uma lista de números'}), 400
+        if len(ids) > TICKETS_MAX_PAGE_SIZE:
+            return jsonify({'error': f'No máximo {TICKETS_MAX_PAGE_SIZE} ids'}), 400
+        with get_db() as conn:
+            tickets = [dict(row) for row in conn.execute(
+                TICKETS_BY_IDS_QUERY.format(ids=', '.join('?' * len(ids))), ids)]
+        return jsonify({'tickets': tickets, 'next_cursor': None})
     
-    ticket = dict(c.fetchone() or {})
+    status_filter = request.args.get('status', 'open')
+    limit = min(max(request.args.get('limit', TICKETS_PAGE_SIZE, type=int), 1), TICKETS_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
     
-    if not ticket:
-        conn.close()
-        return jsonify({'error': 'Ticket não encontrado'}), 404
+    position = None
+    if cursor:
+        # created_at é null no cursor quando a página terminou num ticket sem data
+        position = decode_cursor(cursor, ((str, type(None)), int))
+        if position is None:
+            return jsonify({'error': 'Cursor inválido'}), 400
     
-    # Buscar mensagens
-    c.execute("""
-        SELECT * FROM ticket_messages
-        WHERE ticket_id = ?
-        ORDER BY created_at ASC
-    """, (ticket_id,))
+    return jsonify(list_tickets(status_filter, limit, position))
+
+def list_tickets(status, limit=TICKETS_PAGE_SIZE, position=None):
+    """Uma página de tickets: {'tickets': [...], 'next_cursor': str|None}"""
+    # Busca um registro a mais para saber se existe próxima página
+    if position and position[0] is None:
+        query, params = TICKETS_BY_STATUS_UNDATED_QUERY, (status, position[1], limit + 1)
+    elif position:
+        query, params = TICKETS_BY_STATUS_AFTER_QUERY, (status, *position, limit + 1)
+    else:
+        query, params = TICKETS_BY_STATUS_QUERY, (status, limit + 1)
     
-    messages = [dict(row) for row in c.fetchall()]
-    ticket['messages'] = messages
+    with get_db() as conn:
+        tickets = [dict(row) for row in conn.execute(query, params)]
+        # Acabaram os tickets com data: completa a página com os sem created_at
+        if position and position[0] is not None and len(tickets) <= limit:
+            tickets += [dict(row) for row in conn.execute(
+                TICKETS_BY_STATUS_UNDATED_QUERY, (status, SQLITE_MAX_INTEGER, limit + 1 - len(tickets)))]
     
-    conn.close()
+    next_cursor = None
+    if len(tickets) > limit:
+        tickets = tickets[:limit]
+        last = tickets[-1]
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+    
+    return {'tickets': tickets, 'next_cursor': next_cursor}
+
+@app.route('/api/ticket/<int:ticket_id>')
+@staff_required
+def get_ticket(ticket_id):
+    """Retorna detalhes de um ticket específico com a página mais recente de mensagens
+
+    As mensagens mais antigas ficam em /api/ticket/<id>/messages?before=<id>.
+    """
+    with get_db() as conn:
+        c = conn.cursor()
+        
+        # Buscar ticket
+        c.execute(TICKET_DETAIL_QUERY, (ticket_id,))
+        
+        ticket = dict(c.fetchone() or {})
+        
+        if ticket:
+            # Buscar a página mais recente de mensagens (+1 para saber se há mais)
+            c.execute(TICKET_MESSAGES_LATEST_QUERY, (ticket_id, MESSAGES_PAGE_SIZE + 1))
+            
+            messages = [dict(row) for row in c.fetchall()]
+    
+    if ticket:
+        has_more = len(messages) > MESSAGES_PAGE_SIZE
+        messages = messages[:MESSAGES_PAGE_SIZE]
+        messages.reverse()
+    else:
+        # Não está no banco principal: procurar no arquivo
+        archived = load_archived_ticket(ticket_id)
+        if archived is None:
+            return jsonify({'error': 'Ticket não encontrado'}), 404
+        ticket, all_messages = archived
+        messages, has_more = _archived_messages_page(all_messages)
+    
+    ticket['messages'] = messages
+    ticket['has_more_messages'] = has_more
     
     return jsonify(ticket)
 
+@app.route('/api/ticket/<int:ticket_id>/messages')
+@staff_required
+def get_ticket_messages(ticket_id):
+    """Mensagens de um ticket, paginadas ou em streaming
+
+    Parâmetros:
+      before=<id>   página de mensagens anteriores à mensagem <id>
+      after=<id>    página de mensagens posteriores à mensagem <id>
+      limit         tamanho da página (padrão 100, máx. 500)
+      format=ndjson transmite todas as mensagens (a partir de `after`, se
+                    informado) uma por linha, sem montar a lista em memória
+    """
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    limit = min(max(request.args.get('limit', MESSAGES_PAGE_SIZE, type=int), 1), MESSAGES_MAX_PAGE_SIZE)
+    
+    if before is not None and after is not None:
+        return jsonify({'error': 'Use apenas before ou after'}), 400
+    
+    with get_db() as conn:
+        exists = conn.execute(TICKET_EXISTS_QUERY, (ticket_id,)).fetchone() is not None
+    
+    if not exists:
+        archived = load_archived_ticket(ticket_id)
+        if archived is None:
+            return jsonify({'error': 'Ticket não encontrado'}), 404
+        all_messages = archived[1]
+        
+        if request.args.get('format') == 'ndjson':
+            messages, _ = _archived_messages_page(all_messages, after=after, limit=len(all_messages)) \
+                if after is not None else (all_messages, False)
+            body = ''.join(json.dumps(m, ensure_ascii=False) + '\n' for m in messages)
+            return Response(body, mimetype='application/x-ndjson')
+        
+        messages, has_more = _archived_messages_page(all_messages, before, after, limit)
+        return jsonify({
+            'messages': messages,
+            'has_more': has_more,
+            'before': messages[0]['id'] if messages else before,
+            'after': messages[-1]['id'] if messages else after
+        })
+    
+    if request.args.get('format') == 'ndjson':
+        return Response(iterate_blocking(stream_ticket_messages(ticket_id, after)),
+                        mimetype='application/x-ndjson')
+    
+    with get_db() as conn:
+        if after is not None:
+            rows = conn.execute(TICKET_MESSAGES_AFTER_QUERY, (ticket_id, after, limit + 1)).fetchall()
+        elif before is not None:
+            rows = conn.execute(TICKET_MESSAGES_BEFORE_QUERY, (ticket_id, before, limit + 1)).fetchall()
+        else:
+            rows = conn.execute(TICKET_MESSAGES_LATEST_QUERY, (ticket_id, limit + 1)).fetchall()
+    
+    has_more = len(rows) > limit
+    messages = [dict(row) for row in rows[:limit]]
+    
+    # before/latest vêm da mais nova para a mais antiga: devolver em ordem cronológica
+    if after is None:
+        messages.reverse()
+    
+    return jsonify({
+        'messages': messages,
+        'has_more': has_more,
+        'before': messages[0]['id'] if messages else before,
+        'after': messages[-1]['id'] if messages else after
+    })
+
+def stream_ticket_messages(ticket_id, after=None):
+    """Gera as mensagens do ticket como NDJSON, em lotes paginados por (created_at, id)
+
+    Cada lote pega a conexão do pool só durante a consulta: um cliente lento
+    não segura a conexão entre um yield e outro.
+    """
+    while True:
+        with get_db() as conn:
+            if after is not None:
+                rows = conn.execute(TICKET_MESSAGES_AFTER_QUERY, (ticket_id, after, MESSAGES_STREAM_BATCH)).fetchall()
+            else:
+                rows = conn.execute(TICKET_MESSAGES_FIRST_QUERY, (ticket_id, MESSAGES_STREAM_BATCH)).fetchall()
+        if not rows:
+            return
+        yield ''.join(json.dumps(dict(row), ensure_ascii=False) + '\n' for row in rows)
+        if len(rows) < MESSAGES_STREAM_BATCH:
+            return
+        after = rows[-1]['id']
+
+# =====================================================
+# BUSCA NAS MENSAGENS
+# =====================================================
+SEARCH_MAX_RESULTS = 100
+SEARCH_TERM = re.compile(r'\w+\*?', re.UNICODE)
+
+def build_match_query(text):
+    """Converte o texto digitado numa expressão MATCH segura
+
+    Cada palavra vira um termo entre aspas (todas precisam aparecer);
+    'palavra*' busca por prefixo. Operadores do FTS5 no texto são ignorados.
+    """
+    terms = []
+    for token in SEARCH_TERM.findall(text):
+        prefix = token.endswith('*')
+        word = token.rstrip('*')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+@app.route('/api/search')
+@staff_required
+def search_messages():
+    """Busca textual nas mensagens dos tickets
+
+    Parâmetros: q (obrigatório), status, category_id, from/to (datas ISO,
+    sobre a data da mensagem) e limit (máx. 100). Resultados ordenados por
+    relevância (bm25), com trecho destacado entre **.
+    """
+    if not SEARCH_AVAILABLE:
+        return jsonify({'error': 'Busca indisponível (SQLite sem FTS5)'}), 503
+    
+    match = build_match_query(request.args.get('q', ''))
+    if not match:
+        return jsonify({'error': 'Informe o termo de busca (q)'}), 400
+    
+    limit = min(max(request.args.get('limit', 20, type=int), 1), SEARCH_MAX_RESULTS)
+    try:
+        date_from = normalize_timestamp(request.args.get('from'))
+        to_operator, date_to = upper_date_bound(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    category_id = request.args.get('category_id', type=int)
+    if request.args.get('category_id') and category_id is None:
+        return jsonify({'error': 'category_id inválido'}), 400
+    
+    query = """
+        SELECT m.id AS message_id, m.ticket_id, m.user_id, m.username, m.created_at,
+               snippet(ticket_messages_fts, 0, '**', '**', '…', 16) AS snippet,
+               bm25(ticket_messages_fts) AS rank,
+               t.ticket_number, t.status, t.category_id
+        FROM ticket_messages_fts
+        JOIN ticket_messages m ON m.id = ticket_messages_fts.rowid
+        JOIN tickets t ON t.id = m.ticket_id
+        WHERE ticket_messages_fts MATCH ?
+    """
+    params = [match]
+    
+    if request.args.get('status'):
+        query += " AND t.status = ?"
+        params.append(request.args['status'])
+    if category_id is not None:
+        query += " AND t.category_id = ?"
+        params.append(category_id)
+    if date_from:
+        query += " AND m.created_at >= ?"
+        params.append(date_from)
+    if date_to:
+        query += f" AND m.created_at {to_operator} ?"
+        params.append(date_to)
+    
+    query += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    
+    with get_db() as conn:
+        results = [dict(row) for row in conn.execute(query, params)]
+    
+    return jsonify({'query': match, 'results': results})
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Reconstrói o índice de busca das mensagens (FTS5)"""
+    if not SEARCH_AVAILABLE:
+        print("❌ SQLite sem FTS5: busca indisponível")
+        raise SystemExit(1)
+    
+    started = time.perf_counter()
+    with get_db() as conn:
+        rebuild_search_index(conn)
+        conn.execute("INSERT INTO ticket_messages_fts (ticket_messages_fts) VALUES ('optimize')")
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM ticket_messages").fetchone()[0]
+    print(f"✅ Índice de busca reconstruído: {total} mensagens em {time.perf_counter() - started:.1f}s")
+
+# =====================================================
+# ARQUIVAMENTO DE TICKETS FECHADOS
+# =====================================================
+# Tickets fechados há mais de ARCHIVE_AFTER_DAYS dias saem do banco principal
+# para tickets_archive.db: uma linha por ticket, com as mensagens num JSON
+# comprimido (zlib). Os contadores de /api/stats continuam incluindo os
+# arquivados, e /api/ticket/<id> consulta o arquivo quando não encontra o
+# ticket no banco principal.
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))   # 0 desativa
+ARCHIVE_INTERVAL_HOURS = float(os.getenv('ARCHIVE_INTERVAL_HOURS', 24))
+ARCHIVE_BATCH = 500
+
+ARCHIVED_TICKET_COLUMNS = (
+    'id', 'ticket_number', 'user_id', 'username', 'category_id', 'channel_id',
+    'status', 'priority', 'assigned_to', 'created_at', 'closed_at', 'messages_count'
+)
+
+def create_archive_schema(conn, schema='main'):
+    """Cria a tabela de tickets arquivados (no banco de arquivo)"""
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {schema}.archived_tickets (
+        id INTEGER PRIMARY KEY,
+        ticket_number INTEGER,
+        user_id TEXT,
+        username TEXT,
+        category_id INTEGER,
+        category_name TEXT,
+        category_emoji TEXT,
+        channel_id TEXT,
+        status TEXT,
+        priority TEXT,
+        assigned_to TEXT,
+        created_at TIMESTAMP,
+        closed_at TIMESTAMP,
+        messages_count INTEGER,
+        messages BLOB,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    # Janelas de tempo do agregador de analytics (ver compute_rollups)
+    conn.execute(f'''CREATE INDEX IF NOT EXISTS {schema}.idx_archived_created
+        ON archived_tickets (created_at)''')
+    conn.execute(f'''CREATE INDEX IF NOT EXISTS {schema}.idx_archived_closed
+        ON archived_tickets (closed_at)''')
+
+@contextmanager
+def attached_archive(conn):
+    """Anexa o banco de arquivo como `archive` nesta conexão
+
+    Não pode haver transação aberta; ao sair, confirma a transação feita
+    dentro do bloco e desanexa.
+    """
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_PATH,))
+    try:
+        create_archive_schema(conn, 'archive')
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("DETACH DATABASE archive")
+
+def _pack_messages(messages):
+    return zlib.compress(json.dumps(messages, ensure_ascii=False).encode(), 6)
+
+def _unpack_messages(blob):
+    return json.loads(zlib.decompress(blob)) if blob else []
+
+# Estado atual dos tickets de um lote, para conferir antes de apagá-los
+ARCHIVE_RECHECK_QUERY = """
+    SELECT t.*,
+           (SELECT COUNT(*) FROM ticket_messages m WHERE m.ticket_id = t.id) AS message_total,
+           (SELECT MAX(m.id) FROM ticket_messages m WHERE m.ticket_id = t.id) AS last_message_id
+    FROM tickets t
+    WHERE t.id IN ({ids})
+"""
+
+def _archive_fingerprint(ticket, message_total, last_message_id):
+    """O que precisa continuar igual entre copiar o ticket e apagá-lo"""
+    return tuple(ticket[col] for col in ARCHIVED_TICKET_COLUMNS) + (message_total, last_message_id)
+
+def archive_closed_tickets(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH):
+    """Move tickets fechados antigos (e suas mensagens) para o banco de arquivo
+
+    Trabalha em lotes: grava e confirma o lote no arquivo primeiro e só então
+    apaga do banco principal, então uma falha no meio no máximo deixa uma
+    cópia repetida (que a próxima execução sobrescreve). Na exclusão, só sai
+    do banco principal o ticket que continua igual à cópia (não reaberto, sem
+    mensagens novas); a cópia dos demais é descartada e eles ficam para a
+    próxima execução. Retorna quantos tickets foram arquivados.
+    """
+    archived = 0
+    cutoff = f'-{int(older_than_days)} days'
+    while True:
+        with get_db() as conn:
+            tickets = [dict(row) for row in conn.execute('''
+                SELECT t.*, c.name AS category_name, c.emoji AS category_emoji
+                FROM tickets t
+                LEFT JOIN categories c ON t.category_id = c.id
+                WHERE t.status = 'closed' AND t.closed_at < datetime('now', ?)
+                ORDER BY t.closed_at
+                LIMIT ?
+            ''', (cutoff, batch_size))]
+            if not tickets:
+                break
+            packed = {}
+            for ticket in tickets:
+                messages = [dict(row) for row in conn.execute(TICKET_MESSAGES_QUERY, (ticket['id'],))]
+                ticket['messages'] = _pack_messages(messages)
+                packed[ticket['id']] = _archive_fingerprint(
+                    ticket, len(messages), max((m['id'] for m in messages), default=None)
+                )
+        
+        columns = ARCHIVED_TICKET_COLUMNS + ('category_name', 'category_emoji', 'messages')
+        with get_archive_db() as archive:
+            archive.executemany(
+                f"INSERT OR REPLACE INTO archived_tickets ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [tuple(ticket.get(col) for col in columns) for ticket in tickets]
+            )
+            archive.commit()
+        
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # O lote foi lido fora desta transação: webhooks podem ter gravado
+            # mensagens ou reaberto tickets desde então
+            current = conn.execute(
+                ARCHIVE_RECHECK_QUERY.format(ids=', '.join('?' * len(packed))), list(packed)
+            ).fetchall()
+            ids = [
+                row['id'] for row in current
+                if _archive_fingerprint(row, row['message_total'], row['last_message_id']) == packed[row['id']]
+            ]
+            deleted = 0
+            if ids:
+                where = f"id IN ({','.join('?' * len(ids))}) AND status = 'closed'"
+                # Compensa o trigger de DELETE: arquivados continuam nas estatísticas
+                add_ticket_counters(conn, 'tickets', where, ids)
+                conn.execute(
+                    f"DELETE FROM ticket_messages WHERE ticket_id IN "
+                    f"(SELECT id FROM tickets WHERE {where})", ids
+                )
+                deleted = conn.execute(f"DELETE FROM tickets WHERE {where}", ids).rowcount
+            conn.commit()
+        archived += deleted
+        
+        # Reabertos ou com mensagens novas continuam no banco principal
+        stale = [row['id'] for row in current if row['id'] not in set(ids)]
+        if stale:
+            with get_archive_db() as archive:
+                archive.execute(
+                    f"DELETE FROM archived_tickets WHERE id IN ({','.join('?' * len(stale))})", stale
+                )
+                archive.commit()
+        
+        if len(tickets) < batch_size:
+            break
+    
+    compact_database()
+    return archived
+
+def compact_database():
+    """Devolve ao disco as páginas livres (VACUUM incremental) e trunca o WAL"""
+    with get_db() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.execute("PRAGMA incremental_vacuum")
+        else:
+            print("ℹ️ auto_vacuum desativado neste banco; rode 'flask vacuum-db' uma vez")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def load_archived_ticket(ticket_id):
+    """(ticket, mensagens) de um ticket arquivado, ou None"""
+    with get_archive_db() as archive:
+        row = archive.execute("SELECT * FROM archived_tickets WHERE id = ?", (ticket_id,)).fetchone()
+    if row is None:
+        return None
+    ticket = dict(row)
+    messages = _unpack_messages(ticket.pop('messages'))
+    ticket.pop('archived_at', None)
+    ticket['archived'] = True
+    return ticket, messages
+
+def _archived_messages_page(messages, before=None, after=None, limit=MESSAGES_PAGE_SIZE):
+    """Mesma paginação de /api/ticket/<id>/messages sobre a lista arquivada"""
+    ids = [m['id'] for m in messages]
+    if after is not None:
+        start = ids.index(after) + 1 if after in ids else len(ids)
+        page = messages[start:start + limit]
+        has_more = start + limit < len(messages)
+    else:
+        end = ids.index(before) if before in ids else (len(ids) if before is None else 0)
+        page = messages[max(0, end - limit):end]
+        has_more = end - limit > 0
+    return page, has_more
+
+def _job_archive_tickets(payload):
+    """Job periódico: arquiva e agenda a próxima execução"""
+    try:
+        archived = archive_closed_tickets()
+    finally:
+        schedule_archive_job()
+    return {'archived': archived}
+
+def schedule_archive_job():
+    if ARCHIVE_AFTER_DAYS > 0:
+        # Uma tentativa só: o próprio job agenda a próxima execução
+        job_queue.schedule_unique('archive_tickets', {}, delay=ARCHIVE_INTERVAL_HOURS * 3600,
+                                  max_attempts=1)
+
+@app.cli.command('archive-tickets')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Arquivar tickets fechados há mais de N dias')
+def archive_tickets_command(days):
+    """Arquiva tickets fechados antigos e compacta o banco"""
+    started = time.perf_counter()
+    archived = archive_closed_tickets(older_than_days=days)
+    print(f"✅ {archived} tickets arquivados em {time.perf_counter() - started:.1f}s")
+
+@app.cli.command('vacuum-db')
+def vacuum_db_command():
+    """Ativa o VACUUM incremental e compacta o banco inteiro (pode demorar)"""
+    with get_db() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    print("✅ Banco compactado (auto_vacuum = INCREMENTAL)")
+
+# =====================================================
+# ANALYTICS (séries temporais pré-agregadas)
+# =====================================================
+# ticket_rollups guarda, por hora e por dia, tickets criados e fechados,
+# mensagens e o tempo até o fechamento (soma, mediana e p90), no geral
+# ('all'), por categoria e por staff atribuído. Um job periódico recalcula só
+# a janela recente, então um gráfico de um ano lê algumas centenas de linhas
+# em vez de varrer tickets e mensagens. Mensagens são atribuídas à
+# categoria/staff atual do ticket. Tickets já arquivados entram pelo banco de
+# arquivo, então recalcular dias antigos não apaga o histórico deles.
+ANALYTICS_INTERVAL = int(os.getenv('ANALYTICS_INTERVAL', 300))              # segundos; 0 desativa
+ANALYTICS_LOOKBACK_HOURS = int(os.getenv('ANALYTICS_LOOKBACK_HOURS', 6))
+ANALYTICS_DEFAULT_RANGE = {'hour': timedelta(hours=48), 'day': timedelta(days=30)}
+ANALYTICS_MAX_RANGE = {'hour': timedelta(days=31), 'day': timedelta(days=731)}
+ANALYTICS_BUCKET_FORMAT = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d'}
+ANALYTICS_DIMENSIONS = ('all', 'category', 'staff')
+
+ROLLUP_CREATED_QUERY = """
+    SELECT strftime('%Y-%m-%d %H:00:00', created_at), category_id, assigned_to, COUNT(*)
+    FROM tickets WHERE created_at >= ?
+    GROUP BY 1, 2, 3
+"""
+
+ROLLUP_CLOSED_QUERY = """
+    SELECT strftime('%Y-%m-%d %H:00:00', closed_at), category_id, assigned_to,
+           ROUND(MAX(0, (julianday(closed_at) - julianday(created_at)) * 86400))
+    FROM tickets
+    -- '+status' força o uso de idx_tickets_closed em vez do índice por status
+    WHERE closed_at >= ? AND +status = 'closed' AND created_at IS NOT NULL
+"""
+
+ROLLUP_MESSAGES_QUERY = """
+    SELECT strftime('%Y-%m-%d %H:00:00', m.created_at), t.category_id, t.assigned_to, COUNT(*)
+    FROM ticket_messages m
+    JOIN tickets t ON t.id = m.ticket_id
+    WHERE m.created_at >= ?
+    GROUP BY 1, 2, 3
+"""
+
+# Mesmas agregações sobre o arquivo anexado. Um ticket que está sendo
+# arquivado pode aparecer nos dois bancos por um instante: vale o principal.
+ARCHIVED_ROLLUP_CREATED_QUERY = """
+    SELECT strftime('%Y-%m-%d %H:00:00', created_at), category_id, assigned_to, COUNT(*)
+    FROM archive.archived_tickets
+    WHERE created_at >= ? AND id NOT IN (SELECT id FROM main.tickets)
+    GROUP BY 1, 2, 3
+"""
+
+ARCHIVED_ROLLUP_CLOSED_QUERY = """
+    SELECT strftime('%Y-%m-%d %H:00:00', closed_at), category_id, assigned_to,
+           ROUND(MAX(0, (julianday(closed_at) - julianday(created_at)) * 86400))
+    FROM archive.archived_tickets
+    WHERE closed_at >= ? AND created_at IS NOT NULL AND id NOT IN (SELECT id FROM main.tickets)
+"""
+
+# As mensagens arquivadas estão no JSON comprimido: só os tickets fechados
+# a partir de `since` podem ter mensagens na janela
+ARCHIVED_ROLLUP_MESSAGES_QUERY = """
+    SELECT category_id, assigned_to, messages
+    FROM archive.archived_tickets
+    WHERE closed_at >= ? AND id NOT IN (SELECT id FROM main.tickets)
+"""
+
+def _create_analytics_tables(conn):
+    """Cria a tabela de rollups (hora/dia x dimensão)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS ticket_rollups (
+        granularity TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        key TEXT NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0,
+        closed INTEGER NOT NULL DEFAULT 0,
+        messages INTEGER NOT NULL DEFAULT 0,
+        resolution_seconds REAL NOT NULL DEFAULT 0,
+        resolution_p50 REAL,
+        resolution_p90 REAL,
+        PRIMARY KEY (granularity, dimension, bucket, key)
+    ) WITHOUT ROWID''')
+
+def _percentile(sorted_values, fraction):
+    """Percentil por posição (nearest-rank) de uma lista já ordenada"""
+    index = math.ceil(fraction * len(sorted_values)) - 1
+    return sorted_values[min(max(index, 0), len(sorted_values) - 1)]
+
+def _archived_message_hours(conn, since):
+    """(hora, categoria, staff, mensagens) das mensagens arquivadas a partir de `since`"""
+    counts = {}
+    for category_id, staff, blob in conn.execute(ARCHIVED_ROLLUP_MESSAGES_QUERY, (since,)):
+        for message in _unpack_messages(blob):
+            created_at = message.get('created_at')
+            if created_at and created_at >= since:
+                key = (created_at[:13] + ':00:00', category_id, staff)
+                counts[key] = counts.get(key, 0) + 1
+    return [key + (count,) for key, count in counts.items()]
+
+def compute_rollups(conn, since):
+    """Agrega tickets e mensagens a partir de `since` em linhas de ticket_rollups
+
+    Três consultas por faixa de índice (criação, fechamento, mensagens),
+    agrupadas por hora no SQLite, no banco principal e no arquivo (que deve
+    estar anexado como `archive`); dias e dimensões são somados aqui.
+    """
+    rows = {}
+    durations = {}
+    
+    def targets(hour, category_id, staff):
+        for granularity, bucket in (('hour', hour), ('day', hour[:10])):
+            yield (granularity, 'all', bucket, '')
+            yield (granularity, 'category', bucket, '' if category_id is None else str(category_id))
+            yield (granularity, 'staff', bucket, staff or '')
+    
+    def stats(target):
+        return rows.setdefault(target, {'created': 0, 'closed': 0, 'messages': 0, 'resolution_seconds': 0.0})
+    
+    created = conn.execute(ROLLUP_CREATED_QUERY, (since,)).fetchall()
+    created += conn.execute(ARCHIVED_ROLLUP_CREATED_QUERY, (since,)).fetchall()
+    for hour, category_id, staff, count in created:
+        for target in targets(hour, category_id, staff):
+            stats(target)['created'] += count
+    
+    closed = conn.execute(ROLLUP_CLOSED_QUERY, (since,)).fetchall()
+    closed += conn.execute(ARCHIVED_ROLLUP_CLOSED_QUERY, (since,)).fetchall()
+    for hour, category_id, staff, seconds in closed:
+        for target in targets(hour, category_id, staff):
+            entry = stats(target)
+            entry['closed'] += 1
+            entry['resolution_seconds'] += seconds
+            durations.setdefault(target, []).append(seconds)
+    
+    messages = conn.execute(ROLLUP_MESSAGES_QUERY, (since,)).fetchall()
+    messages += _archived_message_hours(conn, since)
+    for hour, category_id, staff, count in messages:
+        for target in targets(hour, category_id, staff):
+            stats(target)['messages'] += count
+    
+    result = []
+    for target, entry in rows.items():
+        values = sorted(durations.get(target, ()))
+        p50 = _percentile(values, 0.5) if values else None
+        p90 = _percentile(values, 0.9) if values else None
+        result.append(target + (entry['created'], entry['closed'], entry['messages'],
+                                entry['resolution_seconds'], p50, p90))
+    return result
+
+def refresh_rollups(since=None):
+    """Recalcula os rollups de `since` (início de um dia, UTC) até agora
+
+    Sem `since`, recalcula desde o início do dia de ANALYTICS_LOOKBACK_HOURS
+    atrás. Retorna quantas linhas foram gravadas.
+    """
+    if since is None:
+        since = (datetime.utcnow() - timedelta(hours=ANALYTICS_LOOKBACK_HOURS)).strftime('%Y-%m-%d 00:00:00')
+    
+    with get_db() as conn:
+        # Agrega antes de pegar o lock de escrita, numa única transação de
+        # leitura sobre os dois bancos (um ticket sendo arquivado conta uma vez)
+        with attached_archive(conn):
+            conn.execute('BEGIN')
+            rollups = compute_rollups(conn, since)
+        
+        conn.execute('BEGIN IMMEDIATE')
+        dimensions = ', '.join(f"'{d}'" for d in ANALYTICS_DIMENSIONS)
+        for granularity, start in (('hour', since), ('day', since[:10])):
+            conn.execute(
+                f"DELETE FROM ticket_rollups WHERE granularity = ? "
+                f"AND dimension IN ({dimensions}) AND bucket >= ?", (granularity, start)
+            )
+        conn.executemany('''
+            INSERT INTO ticket_rollups (
+                granularity, dimension, bucket, key, created, closed, messages,
+                resolution_seconds, resolution_p50, resolution_p90
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rollups)
+        conn.commit()
+    return len(rollups)
+
+def _job_refresh_analytics(payload):
+    """Job periódico: atualiza a janela recente e agenda a próxima execução"""
+    try:
+        rows = refresh_rollups()
+    finally:
+        schedule_analytics_job()
+    return {'rows': rows}
+
+def schedule_analytics_job(delay=ANALYTICS_INTERVAL):
+    if ANALYTICS_INTERVAL > 0:
+        job_queue.schedule_unique('refresh_analytics', {}, delay=delay, max_attempts=1)
+
+@app.route('/api/analytics')
+@staff_required
+@versioned('ticket_rollups', max_age=60)
+def get_analytics():
+    """Série temporal de volume e tempo de resolução
+
+    Parâmetros: granularity (hour | day), dimension (all | category | staff),
+    from/to (datas ISO; padrão: últimas 48h por hora, últimos 30 dias por dia).
+    `key` de cada ponto é o id da categoria ou do staff ('' = nenhum).
+    """
+    granularity = request.args.get('granularity', 'day')
+    dimension = request.args.get('dimension', 'all')
+    if granularity not in ANALYTICS_BUCKET_FORMAT:
+        return jsonify({'error': 'granularity deve ser hour ou day'}), 400
+    if dimension not in ANALYTICS_DIMENSIONS:
+        return jsonify({'error': 'dimension deve ser all, category ou staff'}), 400
+    
+    try:
+        date_to = normalize_timestamp(request.args.get('to'))
+        date_from = normalize_timestamp(request.args.get('from'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    end = datetime.strptime(date_to, '%Y-%m-%d %H:%M:%S') if date_to else datetime.utcnow()
+    start = datetime.strptime(date_from, '%Y-%m-%d %H:%M:%S') if date_from else end - ANALYTICS_DEFAULT_RANGE[granularity]
+    if start > end or end - start > ANALYTICS_MAX_RANGE[granularity]:
+        return jsonify({'error': 'Intervalo inválido ou grande demais'}), 400
+    
+    bucket_format = ANALYTICS_BUCKET_FORMAT[granularity]
+    start_bucket, end_bucket = start.strftime(bucket_format), end.strftime(bucket_format)
+    
+    with get_db() as conn:
+        rows = conn.execute(ANALYTICS_SERIES_QUERY, (granularity, dimension, start_bucket, end_bucket)).fetchall()
+    
+    series = []
+    for row in rows:
+        point = dict(row)
+        seconds = point.pop('resolution_seconds')
+        point['resolution_avg'] = seconds / point['closed'] if point['closed'] else None
+        series.append(point)
+    
+    return jsonify({
+        'granularity': granularity,
+        'dimension': dimension,
+        'from': start_bucket,
+        'to': end_bucket,
+        'series': series
+    })
+
+@app.cli.command('rebuild-analytics')
+@click.option('--days', default=3650, show_default=True,
+              help='Recalcular os últimos N dias (dias mais antigos são mantidos)')
+def rebuild_analytics_command(days):
+    """Recalcula os rollups de analytics a partir de tickets, mensagens e do arquivo"""
+    started = time.perf_counter()
+    since = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d 00:00:00')
+    rows = refresh_rollups(since)
+    print(f"✅ {rows} linhas de analytics recalculadas em {time.perf_counter() - started:.1f}s")
+
+# =====================================================
+# EXPORTAÇÃO (CSV / NDJSON)
+# =====================================================
+# As exportações leem de um snapshot somente leitura (não seguram conexões
+# do pool nem bloqueiam o bot) em lotes de EXPORT_BATCH linhas, e cada lote
+# já sai codificado (e comprimido) para a resposta: a memória fica constante
+# qualquer que seja o tamanho da exportação.
+EXPORT_BATCH = 1000
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_TICKET_COLUMNS = ARCHIVED_TICKET_COLUMNS
+EXPORT_MESSAGE_COLUMNS = (
+    'id', 'ticket_id', 'ticket_number', 'user_id', 'username', 'content', 'attachments', 'created_at'
+)
+
+def _export_filters(args, ticket, date_column):
+    """Condições SQL de status/category_id (no ticket) e from/to (em `date_column`, se houver)
+
+    Levanta ValueError com a mensagem para o cliente se algum filtro for inválido.
+    """
+    conditions, params = [], []
+    if args.get('status'):
+        conditions.append(f"{ticket}status = ?")
+        params.append(args['status'])
+    if args.get('category_id'):
+        category_id = args.get('category_id', type=int)
+        if category_id is None:
+            raise ValueError('category_id inválido')
+        conditions.append(f"{ticket}category_id = ?")
+        params.append(category_id)
+    date_from = normalize_timestamp(args.get('from')) if date_column else None
+    to_operator, date_to = upper_date_bound(args.get('to')) if date_column else (None, None)
+    if date_from:
+        conditions.append(f"{date_column} >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append(f"{date_column} {to_operator} ?")
+        params.append(date_to)
+    return ' AND '.join(conditions) or '1', params
+
+def _export_ticket_rows(args, include_archived):
+    """Lotes de tuplas de tickets (EXPORT_TICKET_COLUMNS)"""
+    where, params = _export_filters(args, '', 'created_at')
+    columns = ', '.join(EXPORT_TICKET_COLUMNS)
+    with read_snapshot() as conn:
+        cursor = conn.execute(f"SELECT {columns} FROM tickets WHERE {where} ORDER BY id", params)
+        while rows := cursor.fetchmany(EXPORT_BATCH):
+            yield [tuple(row) for row in rows]
+        
+        if include_archived:
+            with read_snapshot(ARCHIVE_PATH) as archive:
+                cursor = archive.execute(
+                    f"SELECT {columns} FROM archived_tickets WHERE {where} ORDER BY id", params)
+                while rows := cursor.fetchmany(EXPORT_BATCH):
+                    # Arquivado depois do snapshot principal: já saiu acima
+                    yield [tuple(row) for row in rows
+                           if conn.execute(TICKET_EXISTS_QUERY, (row['id'],)).fetchone() is None]
+
+def _export_message_rows(args, include_archived):
+    """Lotes de tuplas de mensagens (EXPORT_MESSAGE_COLUMNS)"""
+    where, params = _export_filters(args, 't.', 'm.created_at')
+    with read_snapshot() as conn:
+        cursor = conn.execute(f'''
+            SELECT m.id, m.ticket_id, t.ticket_number, m.user_id, m.username,
+                   m.content, m.attachments, m.created_at
+            FROM ticket_messages m
+            JOIN tickets t ON t.id = m.ticket_id
+            WHERE {where}
+            ORDER BY m.id
+        ''', params)
+        while rows := cursor.fetchmany(EXPORT_BATCH):
+            yield [tuple(row) for row in rows]
+        
+        if include_archived:
+            # Filtros de ticket no SQL; o de data é aplicado às mensagens descomprimidas
+            ticket_where, ticket_params = _export_filters(args, '', None)
+            date_from = normalize_timestamp(args.get('from'))
+            date_to = normalize_timestamp(args.get('to'))
+            with read_snapshot(ARCHIVE_PATH) as archive:
+                cursor = archive.execute(
+                    f"SELECT id, ticket_number, messages FROM archived_tickets "
+                    f"WHERE {ticket_where} ORDER BY id", ticket_params)
+                for ticket in cursor:
+                    if conn.execute(TICKET_EXISTS_QUERY, (ticket['id'],)).fetchone() is not None:
+                        continue
+                    rows = [
+                        tuple(ticket['ticket_number'] if col == 'ticket_number' else message.get(col)
+                              for col in EXPORT_MESSAGE_COLUMNS)
+                        for message in _unpack_messages(ticket['messages'])
+                        if (not date_from or (message.get('created_at') or '') >= date_from)
+                        and (not date_to or (message.get('created_at') or '') <= date_to)
+                    ]
+                    if rows:
+                        yield rows
+
+def _encode_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+def _encode_ndjson(columns, batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+def _gzip_stream(chunks):
+    """Comprime os pedaços de texto em gzip conforme são gerados"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export/<kind>')
+@staff_required
+def export_data(kind):
+    """Exporta tickets ou mensagens (kind = tickets | messages) em streaming
+
+    Parâmetros: format (csv | ndjson), gzip=1, status, category_id, from/to
+    (datas ISO, sobre a criação do ticket ou da mensagem) e archived=1 para
+    incluir os tickets arquivados.
+    """
+    if kind not in ('tickets', 'messages'):
+        return jsonify({'error': 'Exportação inválida (tickets ou messages)'}), 404
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format deve ser csv ou ndjson'}), 400
+    
+    try:
+        # Valida antes de começar a resposta (depois não dá mais para mudar o status)
+        _export_filters(request.args, '', 'created_at')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    include_archived = request.args.get('archived') == '1'
+    if kind == 'tickets':
+        columns, batches = EXPORT_TICKET_COLUMNS, _export_ticket_rows(request.args.copy(), include_archived)
+    else:
+        columns, batches = EXPORT_MESSAGE_COLUMNS, _export_message_rows(request.args.copy(), include_archived)
+    batches = iterate_blocking(batches)     # leituras do SQLite fora da greenlet (modo gevent)
+    
+    encode = _encode_csv if export_format == 'csv' else _encode_ndjson
+    body = encode(columns, batches)
+    mimetype = EXPORT_FORMATS[export_format]
+    filename = f"{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format}"
+    
+    if request.args.get('gzip') == '1':
+        body = _gzip_stream(body)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+
+# =====================================================
+# IMPORTAÇÃO EM MASSA (histórico do bot)
+# =====================================================
+# `flask import-tickets` carrega tickets e mensagens antigos de arquivos
+# JSONL ou CSV numa única transação: os índices secundários e os triggers
+# (contadores, eventos, versões, busca) saem antes da carga e voltam depois,
+# e contadores, índice de busca e analytics são recalculados uma vez só.
+IMPORT_TICKET_FIELDS = (
+    'ticket_number', 'user_id', 'username', 'category_id', 'channel_id',
+    'status', 'priority', 'assigned_to', 'created_at', 'closed_at'
+)
+IMPORT_MESSAGE_FIELDS = ('ticket_number', 'user_id', 'username', 'content', 'attachments', 'created_at')
+
+def read_import_records(path):
+    """Lê um arquivo .csv (com cabeçalho) ou .jsonl/.ndjson, um dict por registro"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            rows = csv.reader(f)
+            header = next(rows, [])
+            for row in rows:
+                yield {key: value for key, value in zip(header, row) if value != ''}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _import_ticket_row(record):
+    if record.get('ticket_number') is None or not record.get('user_id'):
+        raise ValueError('ticket_number e user_id são obrigatórios')
+    closed_at = normalize_timestamp(record.get('closed_at'))
+    return (
+        int(record['ticket_number']),
+        str(record['user_id']),
+        record.get('username'),
+        int(record['category_id']) if record.get('category_id') is not None else None,
+        record.get('channel_id') and str(record['channel_id']),
+        record.get('status') or ('closed' if closed_at else 'open'),
+        record.get('priority') or 'normal',
+        record.get('assigned_to') and str(record['assigned_to']),
+        normalize_timestamp(record.get('created_at')),
+        closed_at
+    )
+
+def _import_message_row(record):
+    if record.get('ticket_number') is None:
+        raise ValueError('ticket_number é obrigatório')
+    attachments = record.get('attachments')
+    if attachments is not None and not isinstance(attachments, str):
+        attachments = json.dumps(attachments)
+    return (
+        int(record['ticket_number']),
+        record.get('user_id') and str(record['user_id']),
+        record.get('username'),
+        record.get('content'),
+        attachments,
+        normalize_timestamp(record.get('created_at'))
+    )
+
+def _message_key(ticket_id, user_id, created_at, content):
+    """Identidade de uma mensagem importada; None se não dá para comparar (sem data)"""
+    if created_at is None:
+        return None
+    digest = hashlib.blake2b((content or '').encode(), digest_size=8).digest()
+    return ticket_id, created_at, user_id, digest
+
+def _new_import_messages(rows, ticket_ids, seen, counts):
+    """Linhas para INSERT: liga ao ticket e pula desconhecidas e repetidas (contando)"""
+    for ticket_number, user_id, username, content, attachments, created_at in rows:
+        ticket_id = ticket_ids.get(ticket_number)
+        if ticket_id is None:
+            counts['skipped'] += 1
+            continue
+        key = _message_key(ticket_id, user_id, created_at, content)
+        if key is not None:
+            if key in seen:
+                counts['duplicates'] += 1
+                continue
+            seen.add(key)
+        yield ticket_id, user_id, username, content, attachments, created_at
+
+def _numbered(records, convert, position):
+    """Converte os registros guardando a posição atual (para a mensagem de erro)"""
+    for position[0], record in enumerate(records, 1):
+        yield convert(record)
+
+def bulk_import(tickets_path=None, messages_path=None):
+    """Importa tickets (idempotente por ticket_number) e mensagens
+
+    As mensagens são ligadas ao ticket pelo ticket_number; mensagens de
+    tickets inexistentes são puladas ('skipped') e as que já existem (mesmo
+    ticket, data, autor e conteúdo) também ('duplicates'), então repetir a
+    importação não duplica nada. Retorna {'tickets': n, 'messages': n,
+    'skipped': n, 'duplicates': n}.
+    """
+    imported = {'tickets': 0, 'messages': 0, 'skipped': 0, 'duplicates': 0}
+    position = [0]
+    with get_db() as conn:
+        # Mensagens também atualizam tickets.messages_count
+        tables = ('tickets', 'ticket_messages') if messages_path else ('tickets',)
+        conn.execute('BEGIN IMMEDIATE')
+        deferred = conn.execute(f'''
+            SELECT type, name FROM sqlite_master
+            WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+              AND tbl_name IN ({', '.join('?' * len(tables))})
+        ''', tables).fetchall()
+        for kind, name in deferred:
+            conn.execute(f'DROP {kind.upper()} "{name}"')
+        
+        try:
+            if tickets_path:
+                position[0], started = 0, time.perf_counter()
+                imported['tickets'] = conn.executemany('''
+                    INSERT OR IGNORE INTO tickets (
+                        ticket_number, user_id, username, category_id, channel_id,
+                        status, priority, assigned_to, created_at, closed_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+                ''', _numbered(read_import_records(tickets_path), _import_ticket_row, position)).rowcount
+                _report_import('tickets', imported['tickets'], time.perf_counter() - started)
+            
+            if messages_path:
+                position[0], started = 0, time.perf_counter()
+                # ticket_number -> id em memória: uma linha por ticket, não por mensagem
+                ticket_ids = dict(conn.execute(
+                    "SELECT ticket_number, id FROM tickets WHERE ticket_number IS NOT NULL"))
+                # Chaves das mensagens já gravadas (os índices estão removidos:
+                # conferir em memória evita uma busca por linha)
+                seen = {
+                    _message_key(*row) for row in conn.execute(
+                        "SELECT ticket_id, user_id, created_at, content FROM ticket_messages")
+                }
+                rows = _numbered(read_import_records(messages_path), _import_message_row, position)
+                imported['messages'] = conn.executemany('''
+                    INSERT INTO ticket_messages (ticket_id, user_id, username, content, attachments, created_at)
+                    VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                ''', _new_import_messages(rows, ticket_ids, seen, imported)).rowcount
+                conn.execute('''
+                    UPDATE tickets SET messages_count = counts.total
+                    FROM (SELECT ticket_id, COUNT(*) AS total FROM ticket_messages GROUP BY ticket_id) AS counts
+                    WHERE counts.ticket_id = tickets.id AND tickets.messages_count IS NOT counts.total
+                ''')
+                _report_import('mensagens', imported['messages'], time.perf_counter() - started)
+                if imported['skipped'] or imported['duplicates']:
+                    print(f"   {imported['skipped']} mensagens de tickets inexistentes e "
+                          f"{imported['duplicates']} já importadas foram puladas")
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f'Registro {position[0]}: {e}') from e
+        
+        started = time.perf_counter()
+        if messages_path:
+            rebuild_search_index(conn)
+        conn.execute("UPDATE table_versions SET version = version + 1 WHERE name = 'tickets'")
+        # Recria índices e triggers e confirma a transação; como os triggers
+        # de contadores foram removidos, ele também recalcula ticket_counters
+        _create_schema(conn)
+        print(f"   índices, busca e contadores recriados em {time.perf_counter() - started:.1f}s")
+        
+        oldest = conn.execute("SELECT MIN(created_at) FROM tickets").fetchone()[0]
+    
+    if oldest:
+        refresh_rollups(oldest[:10] + ' 00:00:00')
+    return imported
+
+def _report_import(label, rows, seconds):
+    rate = rows / seconds if seconds > 0 else rows
+    print(f"   {rows} {label} em {seconds:.1f}s ({rate:,.0f} linhas/s)")
+
+@app.cli.command('import-tickets')
+@click.option('--tickets', 'tickets_path', type=click.Path(exists=True, dir_okay=False),
+              help='Arquivo .jsonl/.csv de tickets')
+@click.option('--messages', 'messages_path', type=click.Path(exists=True, dir_okay=False),
+              help='Arquivo .jsonl/.csv de mensagens (ligadas por ticket_number)')
+def import_tickets_command(tickets_path, messages_path):
+    """Importa o histórico de tickets/mensagens do bot (pause os webhooks antes)"""
+    if not tickets_path and not messages_path:
+        raise click.UsageError('Informe --tickets e/ou --messages')
+    
+    started = time.perf_counter()
+    try:
+        imported = bulk_import(tickets_path, messages_path)
+    except ValueError as e:
+        print(f"❌ Importação desfeita: {e}")
+        raise SystemExit(1)
+    print(f"✅ {imported['tickets']} tickets e {imported['messages']} mensagens importados "
+          f"em {time.perf_counter() - started:.1f}s ({imported['skipped']} mensagens sem ticket e "
+          f"{imported['duplicates']} repetidas puladas)")
+
 # =====================================================
 # ROTAS DE CATEGORIAS
 # =====================================================
@@ -477,91 +2661,93 @@ def get_ticket(ticket_id):
 @staff_required
 def categories_page():
     """Página de gerenciamento de categorias"""
-    return render_template('categories.html', user=session['user'])
+    return render_template('categories.html', user=session['user'],
+                           initial_state=load_page_state('categories'))
+
+def list_categories(conn=None):
+    """Todas as categorias, mais recentes primeiro"""
+    if conn is None:
+        with get_db() as conn:
+            return list_categories(conn)
+    return [dict(row) for row in conn.execute(CATEGORIES_LIST_QUERY)]
 
 @app.route('/api/categories', methods=['GET', 'POST'])
 @staff_required
+@versioned('categories', max_age=15)
 def categories():
     """CRUD de categorias"""
-    conn = sqlite3.connect('tickets.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    with get_db() as conn:
+        c = conn.cursor()
     
-    if request.method == 'GET':
-        c.execute("SELECT * FROM categories ORDER BY created_at DESC")
-        categories_list = [dict(row) for row in c.fetchall()]
-        conn.close()
-        return jsonify(categories_list)
+        if request.method == 'GET':
+            return jsonify(list_categories(conn))
     
-    elif request.method == 'POST':
-        data = request.json
+        elif request.method == 'POST':
+            data = request.json
         
-        c.execute("""
-            INSERT INTO categories (
-                name, emoji, description, channel_category_id,
-                channel_name_template, allowed_roles, mention_role_id,
-                initial_message, buttons_config, color
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get('name'),
-            data.get('emoji'),
-            data.get('description'),
-            data.get('channel_category_id'),
-            data.get('channel_name_template'),
-            json.dumps(data.get('allowed_roles', [])),
-            data.get('mention_role_id'),
-            data.get('initial_message'),
-            json.dumps(data.get('buttons_config', [])),
-            data.get('color', '#FF8C00')
-        ))
+            c.execute("""
+                INSERT INTO categories (
+                    name, emoji, description, channel_category_id,
+                    channel_name_template, allowed_roles, mention_role_id,
+                    initial_message, buttons_config, color
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data.get('name'),
+                data.get('emoji'),
+                data.get('description'),
+                data.get('channel_category_id'),
+                data.get('channel_name_template'),
+                json.dumps(data.get('allowed_roles', [])),
+                data.get('mention_role_id'),
+                data.get('initial_message'),
+                json.dumps(data.get('buttons_config', [])),
+                data.get('color', '#FF8C00')
+            ))
         
-        conn.commit()
-        category_id = c.lastrowid
-        conn.close()
+            conn.commit()
+            category_id = c.lastrowid
         
-        return jsonify({'id': category_id, 'message': 'Categoria criada!'}), 201
+            return jsonify({'id': category_id, 'message': 'Categoria criada!'}), 201
 
 @app.route('/api/categories/<int:category_id>', methods=['PUT', 'DELETE'])
 @staff_required
 def category_detail(category_id):
     """Editar ou deletar categoria"""
-    conn = sqlite3.connect('tickets.db')
-    c = conn.cursor()
+    with get_db() as conn:
+        c = conn.cursor()
     
-    if request.method == 'PUT':
-        data = request.json
-        
-        c.execute("""
-            UPDATE categories SET
-                name=?, emoji=?, description=?, channel_category_id=?,
-                channel_name_template=?, allowed_roles=?, mention_role_id=?,
-                initial_message=?, buttons_config=?, color=?
-            WHERE id=?
-        """, (
-            data.get('name'),
-            data.get('emoji'),
-            data.get('description'),
-            data.get('channel_category_id'),
-            data.get('channel_name_template'),
-            json.dumps(data.get('allowed_roles', [])),
-            data.get('mention_role_id'),
-            data.get('initial_message'),
-            json.dumps(data.get('buttons_config', [])),
-            data.get('color'),
-            category_id
-        ))
+        if request.method == 'PUT':
+            data = request.json
         
-        conn.commit()
-        conn.close()
+            c.execute("""
+                UPDATE categories SET
+                    name=?, emoji=?, description=?, channel_category_id=?,
+                    channel_name_template=?, allowed_roles=?, mention_role_id=?,
+                    initial_message=?, buttons_config=?, color=?
+                WHERE id=?
+            """, (
+                data.get('name'),
+                data.get('emoji'),
+                data.get('description'),
+                data.get('channel_category_id'),
+                data.get('channel_name_template'),
+                json.dumps(data.get('allowed_roles', [])),
+                data.get('mention_role_id'),
+                data.get('initial_message'),
+                json.dumps(data.get('buttons_config', [])),
+                data.get('color'),
+                category_id
+            ))
         
-        return jsonify({'message': 'Categoria atualizada!'})
+            conn.commit()
+        
+            return jsonify({'message': 'Categoria atualizada!'})
     
-    elif request.method == 'DELETE':
-        c.execute("DELETE FROM categories WHERE id=?", (category_id,))
-        conn.commit()
-        conn.close()
+        elif request.method == 'DELETE':
+            c.execute("DELETE FROM categories WHERE id=?", (category_id,))
+            conn.commit()
         
-        return jsonify({'message': 'Categoria deletada!'})
+            return jsonify({'message': 'Categoria deletada!'})
 
 # =====================================================
 # ROTAS DE PAINÉIS
@@ -570,110 +2756,494 @@ def category_detail(category_id):
 @staff_required
 def panels_page():
     """Página de gerenciamento de painéis"""
-    return render_template('panels.html', user=session['user'])
+    return render_template('panels.html', user=session['user'],
+                           initial_state=load_page_state('panels'))
+
+def list_panels(conn=None):
+    """Todos os painéis, mais recentes primeiro"""
+    if conn is None:
+        with get_db() as conn:
+            return list_panels(conn)
+    return [dict(row) for row in conn.execute(PANELS_LIST_QUERY)]
 
 @app.route('/api/panels', methods=['GET', 'POST'])
 @staff_required
+@versioned('panels', max_age=15)
 def panels():
     """CRUD de painéis"""
-    conn = sqlite3.connect('tickets.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    with get_db() as conn:
+        c = conn.cursor()
     
-    if request.method == 'GET':
-        c.execute("SELECT * FROM panels ORDER BY created_at DESC")
-        panels_list = [dict(row) for row in c.fetchall()]
-        conn.close()
-        return jsonify(panels_list)
+        if request.method == 'GET':
+            return jsonify(list_panels(conn))
     
-    elif request.method == 'POST':
-        data = request.json
+        elif request.method == 'POST':
+            data = request.json
         
-        c.execute("""
-            INSERT INTO panels (
-                name, title, description, color, image_url,
-                thumbnail_url, footer, channel_id, panel_type, categories
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get('name'),
-            data.get('title'),
-            data.get('description'),
-            data.get('color', '#FF8C00'),
-            data.get('image_url'),
-            data.get('thumbnail_url'),
-            data.get('footer'),
-            data.get('channel_id'),
-            data.get('panel_type', 'buttons'),
-            json.dumps(data.get('categories', []))
-        ))
+            c.execute("""
+                INSERT INTO panels (
+                    name, title, description, color, image_url,
+                    thumbnail_url, footer, channel_id, panel_type, categories
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data.get('name'),
+                data.get('title'),
+                data.get('description'),
+                data.get('color', '#FF8C00'),
+                data.get('image_url'),
+                data.get('thumbnail_url'),
+                data.get('footer'),
+                data.get('channel_id'),
+                data.get('panel_type', 'buttons'),
+                json.dumps(data.get('categories', []))
+            ))
         
-        conn.commit()
-        panel_id = c.lastrowid
-        conn.close()
+            conn.commit()
+            panel_id = c.lastrowid
         
-        return jsonify({'id': panel_id, 'message': 'Painel criado!'}), 201
+            return jsonify({'id': panel_id, 'message': 'Painel criado!'}), 201
+
+# =====================================================
+# WEBHOOKS DO BOT (ingestão de tickets e mensagens)
+# =====================================================
+# As escritas passam pela WriteQueue: mensagens que chegam juntas (de uma
+# ou várias requisições) viram um único INSERT em lote, um UPDATE de
+# messages_count por ticket e um único COMMIT.
+WEBHOOK_MAX_BATCH = 1000
+WEBHOOK_WRITE_TIMEOUT = 30      # segundos esperando o COMMIT da WriteQueue
+
+# Tipos aceitos nos campos dos webhooks (ids do Discord podem vir como texto)
+WEBHOOK_FIELD_TYPES = {
+    'ticket_id': int,
+    'ticket_number': int,
+    'category_id': int,
+    'user_id': (str, int),
+    'channel_id': (str, int),
+    'username': str,
+    'content': str,
+    'priority': str,
+    'attachments': list,
+    'created_at': str,
+    'closed_at': str,
+}
+
+def bot_authorized():
+    """True se a requisição traz Authorization: Bearer <DASHBOARD_SECRET>"""
+    auth = request.headers.get('Authorization', '')
+    return bool(DASHBOARD_SECRET) and hmac.compare_digest(auth.encode(), f'Bearer {DASHBOARD_SECRET}'.encode())
+
+def webhook_auth_required(f):
+    """Requer o cabeçalho Authorization: Bearer <DASHBOARD_SECRET>"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not DASHBOARD_SECRET:
+            return jsonify({'error': 'Webhook não configurado (DASHBOARD_SECRET)'}), 503
+        
+        if not bot_authorized():
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        return f(*args, **kwargs)
+    return decorated_function
+
+def normalize_timestamp(value):
+    """Converte um ISO 8601 para o formato do SQLite em UTC ('YYYY-MM-DD HH:MM:SS')
+
+    Mantém todas as datas no mesmo formato do CURRENT_TIMESTAMP, para que a
+    ordenação por texto (índices e paginação) continue correta.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Data inválida: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(sep=' ', timespec='seconds')
+
+def upper_date_bound(value):
+    """(operador, timestamp) de um filtro `to`; (None, None) se vazio
+
+    Uma data sem hora ('2025-01-31') inclui o dia inteiro: vira
+    '< 2025-02-01 00:00:00' em vez de '<= 2025-01-31 00:00:00'.
+    """
+    timestamp = normalize_timestamp(value)
+    if timestamp is None:
+        return None, None
+    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', str(value).strip()):
+        next_day = datetime.fromisoformat(timestamp) + timedelta(days=1)
+        return '<', next_day.isoformat(sep=' ', timespec='seconds')
+    return '<=', timestamp
+
+def _write_tickets_created(conn, payloads):
+    """Insere tickets (idempotente por ticket_number); retorna os ids"""
+    conn.executemany('''
+        INSERT OR IGNORE INTO tickets (
+            ticket_number, user_id, username, category_id,
+            channel_id, status, priority, created_at
+        ) VALUES (?, ?, ?, ?, ?, 'open', ?, COALESCE(?, CURRENT_TIMESTAMP))
+    ''', [(
+        p['ticket_number'],
+        p['user_id'],
+        p.get('username'),
+        p.get('category_id'),
+        p.get('channel_id'),
+        p.get('priority') or 'normal',
+        p.get('created_at')
+    ) for p in payloads])
+    
+    return [
+        conn.execute("SELECT id FROM tickets WHERE ticket_number = ?", (p['ticket_number'],)).fetchone()[0]
+        for p in payloads
+    ]
+
+def _existing_ticket_ids(conn, ticket_ids):
+    """Quais destes ids existem na tabela tickets"""
+    ticket_ids = list(ticket_ids)
+    return {row[0] for row in conn.execute(
+        f"SELECT id FROM tickets WHERE id IN ({', '.join('?' * len(ticket_ids))})", ticket_ids
+    )}
+
+def _write_ticket_messages(conn, payloads):
+    """Insere mensagens em lote e soma messages_count uma vez por ticket
+
+    Mensagens de tickets inexistentes não são gravadas (resultado False).
+    """
+    existing = _existing_ticket_ids(conn, {p['ticket_id'] for p in payloads})
+    stored = [p for p in payloads if p['ticket_id'] in existing]
+    
+    conn.executemany('''
+        INSERT INTO ticket_messages (
+            ticket_id, user_id, username, content, attachments, created_at
+        ) VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+    ''', [(
+        p['ticket_id'],
+        p.get('user_id'),
+        p.get('username'),
+        p.get('content'),
+        json.dumps(p.get('attachments', [])),
+        p.get('created_at')
+    ) for p in stored])
+    
+    per_ticket = {}
+    for p in stored:
+        per_ticket[p['ticket_id']] = per_ticket.get(p['ticket_id'], 0) + 1
+    conn.executemany(
+        "UPDATE tickets SET messages_count = messages_count + ? WHERE id = ?",
+        [(count, ticket_id) for ticket_id, count in per_ticket.items()]
+    )
+    return [p['ticket_id'] in existing for p in payloads]
+
+def _write_tickets_closed(conn, payloads):
+    """Fecha tickets; retorna se cada um foi alterado"""
+    results = []
+    for p in payloads:
+        c = conn.execute('''
+            UPDATE tickets
+            SET status = 'closed', closed_at = COALESCE(?, CURRENT_TIMESTAMP)
+            WHERE id = ? AND status != 'closed'
+        ''', (p.get('closed_at'), p['ticket_id']))
+        results.append(c.rowcount > 0)
+    return results
+
+write_queue = WriteQueue({
+    'ticket_created': _write_tickets_created,
+    'ticket_message': _write_ticket_messages,
+    'ticket_closed': _write_tickets_closed,
+})
+
+def _parse_webhook_payload(data, required):
+    """Valida campos obrigatórios e tipos e normaliza datas; levanta ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Payload deve ser um objeto JSON')
+    missing = [field for field in required if data.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Campos obrigatórios ausentes: {', '.join(missing)}")
+    for field, expected in WEBHOOK_FIELD_TYPES.items():
+        value = data.get(field)
+        # bool é subclasse de int no Python, mas true não é um id
+        if value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            raise ValueError(f'Campo {field} com tipo inválido')
+    if not all(isinstance(url, str) for url in data.get('attachments') or []):
+        raise ValueError('Campo attachments deve ser uma lista de URLs')
+    
+    payload = dict(data)
+    for field in ('created_at', 'closed_at'):
+        if field in payload:
+            payload[field] = normalize_timestamp(payload[field])
+    return payload
+
+def _lookup_ticket_ids(ticket_ids):
+    with get_db() as conn:
+        return _existing_ticket_ids(conn, ticket_ids)
+
+def _await_writes(futures):
+    """Espera o COMMIT das escritas: (resultados, None) ou (None, resposta JSON de erro)"""
+    try:
+        return [future.result(timeout=WEBHOOK_WRITE_TIMEOUT) for future in futures], None
+    except FutureTimeoutError:
+        print(f"⚠️ Webhook esperou mais de {WEBHOOK_WRITE_TIMEOUT}s pela gravação")
+        return None, (jsonify({'error': 'Banco ocupado, tente novamente'}), 503)
+    except Exception as e:
+        print(f"❌ Erro ao gravar webhook: {e}")
+        return None, (jsonify({'error': 'Erro ao gravar no banco'}), 500)
+
+@app.route('/api/webhook/ticket-created', methods=['POST'])
+@webhook_auth_required
+def webhook_ticket_created():
+    """Bot avisa que um ticket foi criado"""
+    try:
+        payload = _parse_webhook_payload(request.get_json(silent=True), ('ticket_number', 'user_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results, error = _await_writes([write_queue.submit('ticket_created', payload)])
+    if error:
+        return error
+    return jsonify({'success': True, 'ticket_id': results[0]})
+
+@app.route('/api/webhook/ticket-message', methods=['POST'])
+@webhook_auth_required
+def webhook_ticket_message():
+    """Bot registra uma mensagem de ticket"""
+    try:
+        payload = _parse_webhook_payload(request.get_json(silent=True), ('ticket_id',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results, error = _await_writes([write_queue.submit('ticket_message', payload)])
+    if error:
+        return error
+    if not results[0]:
+        return jsonify({'error': 'Ticket não encontrado', 'ticket_id': payload['ticket_id']}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/webhook/ticket-messages', methods=['POST'])
+@webhook_auth_required
+def webhook_ticket_messages_batch():
+    """Bot registra várias mensagens de uma vez: {"messages": [...]} ou [...]"""
+    data = request.get_json(silent=True)
+    messages = data.get('messages') if isinstance(data, dict) else data
+    if not isinstance(messages, list) or not messages:
+        return jsonify({'error': 'Envie uma lista de mensagens'}), 400
+    if len(messages) > WEBHOOK_MAX_BATCH:
+        return jsonify({'error': f'Máximo de {WEBHOOK_MAX_BATCH} mensagens por lote'}), 413
+    
+    try:
+        payloads = [_parse_webhook_payload(m, ('ticket_id',)) for m in messages]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Lote tudo ou nada: com algum ticket inexistente nada é gravado
+    ticket_ids = {p['ticket_id'] for p in payloads}
+    unknown = sorted(ticket_ids - run_blocking(_lookup_ticket_ids, ticket_ids))
+    if unknown:
+        return jsonify({'error': 'Tickets não encontrados', 'ticket_ids': unknown}), 404
+    
+    results, error = _await_writes(write_queue.submit_many('ticket_message', payloads))
+    if error:
+        return error
+    return jsonify({'success': True, 'count': sum(results)})
+
+@app.route('/api/webhook/ticket-closed', methods=['POST'])
+@webhook_auth_required
+def webhook_ticket_closed():
+    """Bot avisa que um ticket foi fechado"""
+    try:
+        payload = _parse_webhook_payload(request.get_json(silent=True), ('ticket_id',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results, error = _await_writes([write_queue.submit('ticket_closed', payload)])
+    if error:
+        return error
+    return jsonify({'success': True, 'closed': results[0]})
 
 # =====================================================
 # INTEGRAÇÃO COM DISCORD BOT
 # =====================================================
+# Tudo que vai para o bot passa pela fila de jobs (bot_jobs): a rota grava o
+# job e responde na hora com o id; uma thread em segundo plano faz a entrega
+# com retries, então nenhum worker fica esperando o bot acordar no Render.
+BOT_TIMEOUT = (5, int(os.getenv('BOT_TIMEOUT', 60)))
+
+bot_session = requests.Session()
+
+def _post_to_bot(path, payload, idempotency_key=None):
+    """POST no bot; levanta exceção (e o job é refeito) se falhar"""
+    headers = {'Authorization': f'Bearer {DASHBOARD_SECRET}'} if DASHBOARD_SECRET else {}
+    if idempotency_key:
+        headers['Idempotency-Key'] = idempotency_key
+    response = bot_session.post(f'{BOT_URL}{path}', json=payload, headers=headers, timeout=BOT_TIMEOUT)
+    if response.status_code >= 400:
+        raise RuntimeError(f'Bot retornou HTTP {response.status_code}: {response.text[:200]}')
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+def _job_send_panel(payload):
+    """Publica um painel: envia painel + categorias ao bot e guarda o message_id"""
+    with get_db() as conn:
+        panel = conn.execute("SELECT * FROM panels WHERE id = ?", (payload['panel_id'],)).fetchone()
+        if panel is None:
+            raise RuntimeError(f"Painel {payload['panel_id']} não existe mais")
+        panel = dict(panel)
+        category_ids = json.loads(panel.get('categories') or '[]')
+        categories_list = [
+            dict(row) for row in conn.execute(
+                f"SELECT * FROM categories WHERE id IN ({','.join('?' * len(category_ids))})", category_ids
+            )
+        ] if category_ids else []
+    
+    # Publicar não é idempotente: um timeout de leitura não diz se o bot já
+    # postou, então todas as tentativas levam a mesma chave e o bot devolve o
+    # message_id do envio anterior em vez de postar outro painel.
+    result = _post_to_bot(
+        '/send_panel', {'panel': panel, 'categories': categories_list},
+        idempotency_key=payload.get('idempotency_key')
+    )
+    message_id = result.get('message_id')
+    if message_id:
+        with get_db() as conn:
+            conn.execute("UPDATE panels SET message_id = ? WHERE id = ?", (str(message_id), panel['id']))
+            conn.commit()
+    return {'message_id': message_id}
+
+def _job_config_update(payload):
+    """Avisa o bot que algum sistema foi ligado/desligado"""
+    return _post_to_bot('/config_update', payload)
+
+def _job_test_connection(payload):
+    """Pede ao bot para mandar uma mensagem de teste num canal"""
+    return _post_to_bot('/test_connection', payload)
+
+job_queue = JobQueue({
+    'send_panel': _job_send_panel,
+    'config_update': _job_config_update,
+    'test_connection': _job_test_connection,
+    'archive_tickets': _job_archive_tickets,
+    'refresh_analytics': _job_refresh_analytics,
+    'revalidate_sessions': _job_revalidate_sessions,
+    'prune_events': _job_prune_events,
+})
+
+@app.route('/api/jobs/<int:job_id>')
+@staff_required
+def get_job_status(job_id):
+    """Estado de um job da fila (pending, running, done, failed)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job)
+
 @app.route('/api/discord/send-panel', methods=['POST'])
 @staff_required
 def send_panel_to_discord():
-    """Envia painel para o Discord via bot"""
-    data = request.json
+    """Envia painel para o Discord via bot (assíncrono, retorna o id do job)"""
+    data = request.get_json(silent=True) or {}
     panel_id = data.get('panel_id')
+    if not panel_id:
+        return jsonify({'success': False, 'message': 'panel_id é obrigatório'}), 400
     
-    # Aqui você faria uma requisição para o bot Discord
-    # enviando os dados do painel para ele criar no Discord
+    job_id = job_queue.enqueue('send_panel', {
+        'panel_id': panel_id,
+        'idempotency_key': f'panel-{panel_id}-{secrets.token_hex(8)}'
+    })
     
-    # Por enquanto, apenas simulamos
     return jsonify({
         'success': True,
-        'message': 'Painel enviado para o Discord!',
-        'message_id': '123456789'
-    })
+        'message': 'Painel na fila de envio para o Discord!',
+        'job_id': job_id
+    }), 202
 
 # =====================================================
 # CONFIGURAÇÕES DE SISTEMAS (Welcome, Tickets, etc)
 # =====================================================
+DEFAULT_WELCOME_CONFIG = {
+    'welcome_enabled': True,
+    'goodbye_enabled': True,
+    'autorole_enabled': True,
+    'tickets_enabled': True,
+    'status_message_id': None
+}
+
+# Cache por processo: (versão da tabela config, valor). Outros workers
+# percebem a mudança pelo contador em table_versions (ver table_versions()).
+CONFIG_LONG_POLL_MAX = 55  # segundos (abaixo do timeout típico de proxies)
+# Long-polls esperando ao mesmo tempo neste processo; além disso a resposta
+# volta na hora com Retry-After, sem segurar a thread
+CONFIG_LONG_POLL_MAX_WAITERS = int(os.getenv('CONFIG_LONG_POLL_MAX_WAITERS', 4))
+CONFIG_LONG_POLL_RETRY_AFTER = 5
+
+_config_waiters = threading.BoundedSemaphore(CONFIG_LONG_POLL_MAX_WAITERS)
+
+_config_lock = threading.Condition()
+_config_cache = (None, None)
+
+def config_version():
+    """Versão atual da tabela config (lida do snapshot de versões)"""
+    return table_versions().get('config', 0)
+
 def load_welcome_config():
-    """Carrega configurações do banco de dados"""
+    """Carrega configurações (do cache em memória se a versão não mudou)"""
+    global _config_cache
+    version = config_version()
+    cached_version, cached = _config_cache
+    if cached is not None and cached_version == version:
+        return dict(cached)
+    
     try:
-        conn = sqlite3.connect('tickets.db')
-        c = conn.cursor()
-        c.execute("SELECT value FROM config WHERE key = 'welcome_config'")
-        result = c.fetchone()
-        conn.close()
-        
-        if result:
-            return json.loads(result[0])
-    except:
-        pass
-    
-    # Padrão se não existir
-    default_config = {
-        'welcome_enabled': True,
-        'goodbye_enabled': True,
-        'autorole_enabled': True,
-        'tickets_enabled': True,
-        'status_message_id': None
-    }
-    save_welcome_config(default_config)  # Salvar no DB
-    return default_config
+        result = run_blocking(_read_config_value, 'welcome_config')
+        config = json.loads(result[0]) if result else dict(DEFAULT_WELCOME_CONFIG)
+    except Exception as e:
+        print(f"Erro ao carregar config: {e}")
+        return dict(cached if cached is not None else DEFAULT_WELCOME_CONFIG)
+    
+    _config_cache = (version, config)
+    return dict(config)
 
-def save_welcome_config(config):
-    """Salva configurações no banco de dados"""
-    try:
-        conn = sqlite3.connect('tickets.db')
-        c = conn.cursor()
-        c.execute('''
+def _read_config_value(key):
+    with get_db() as conn:
+        return conn.execute(CONFIG_VALUE_QUERY, (key,)).fetchone()
+
+def _write_welcome_config(config):
+    """Grava a config; retorna a nova versão da tabela"""
+    with get_db() as conn:
+        conn.execute('''
             INSERT OR REPLACE INTO config (key, value) 
             VALUES ('welcome_config', ?)
         ''', (json.dumps(config),))
+        version = conn.execute("SELECT version FROM table_versions WHERE name = 'config'").fetchone()[0]
         conn.commit()
-        conn.close()
+    return version
+
+def save_welcome_config(config):
+    """Salva configurações no banco de dados (write-through no cache)"""
+    global _config_cache
+    try:
+        version = run_blocking(_write_welcome_config, config)
     except Exception as e:
         print(f"Erro ao salvar config: {e}")
+        return
+    
+    invalidate_table_versions()
+    with _config_lock:
+        _config_cache = (version, dict(config))
+        _config_lock.notify_all()
+
+def wait_for_config_change(version, timeout):
+    """Espera até a versão da config ser diferente de `version` (ou timeout)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        current = config_version()
+        remaining = deadline - time.monotonic()
+        if current != version or remaining <= 0:
+            return current
+        # Acorda na hora se a mudança for deste processo; senão, revisa o
+        # snapshot de versões (mudanças de outros workers) a cada segundo
+        with _config_lock:
+            _config_lock.wait(timeout=min(remaining, 1))
 
 @app.route('/config')
 @staff_required
@@ -710,13 +3280,14 @@ def toggle_system(system):
         
         save_welcome_config(config)
         
-        # TODO: Aqui você pode fazer uma requisição para o bot atualizar o painel no Discord
-        # usando webhook ou API do bot
+        # Avisar o bot em segundo plano (atualiza o painel de status no Discord)
+        job_id = job_queue.enqueue('config_update', {'system': system, 'config': config})
         
         return jsonify({
             'success': True,
             'message': message,
-            'enabled': config.get(f'{system}_enabled', False)
+            'enabled': config.get(f'{system}_enabled', False),
+            'job_id': job_id
         })
     
     except Exception as e:
@@ -724,42 +3295,127 @@ def toggle_system(system):
 
 @app.route('/api/config/status')
 def get_config_status():
-    """Retorna o status atual de todos os sistemas (público para o bot acessar)"""
-    config = load_welcome_config()
-    return jsonify(config)
+    """Retorna o status atual de todos os sistemas (público para o bot acessar)
+
+    Long-poll (só para o bot, com Authorization: Bearer <DASHBOARD_SECRET>):
+    envie If-None-Match com a ETag da última resposta e ?wait=<segundos>
+    (máx. 55). A resposta só volta quando a configuração mudar (200) ou o
+    tempo acabar (304), então o bot fica sabendo de um toggle na hora sem
+    precisar fazer polling. Se já houver CONFIG_LONG_POLL_MAX_WAITERS
+    esperando, o 304 volta na hora com Retry-After.
+    """
+    wait = min(max(request.args.get('wait', 0, type=float), 0), CONFIG_LONG_POLL_MAX)
+    if wait:
+        if not DASHBOARD_SECRET:
+            return jsonify({'error': 'Long-poll não configurado (DASHBOARD_SECRET)'}), 503
+        if not bot_authorized():
+            return jsonify({'error': 'Unauthorized'}), 401
+    
+    version = config_version()
+    etag = f'config-{version}'
+    
+    if request.if_none_match.contains(etag):
+        busy = False
+        if wait:
+            if _config_waiters.acquire(blocking=False):
+                try:
+                    version = wait_for_config_change(version, wait)
+                finally:
+                    _config_waiters.release()
+                etag = f'config-{version}'
+            else:
+                busy = True
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            if busy:
+                response.headers['Retry-After'] = str(CONFIG_LONG_POLL_RETRY_AFTER)
+            return response
+    
+    response = jsonify(load_welcome_config())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/test_bot', methods=['POST'])
 @staff_required
 def test_bot_connection():
-    """Testa conexão com o bot enviando mensagem em um canal"""
+    """Testa conexão com o bot enviando mensagem em um canal (assíncrono)
+
+    Retorna o id do job; acompanhe em /api/jobs/<id>.
+    """
     try:
         data = request.get_json()
         channel_id = data.get('channel_id')
         message = data.get('message', '🧪 Teste de conexão Dashboard → Bot')
         
-        # URL do bot no Render
-        bot_url = os.getenv('BOT_URL', 'https://caosbot-discord.onrender.com')
-        
-        response = requests.post(
-            f'{bot_url}/test_connection',
-            json={'channel_id': channel_id, 'message': message},
-            timeout=15
+        # Poucas tentativas: é um teste interativo
+        job_id = job_queue.enqueue(
+            'test_connection', {'channel_id': channel_id, 'message': message}, max_attempts=2
         )
         
-        if response.status_code == 200:
-            return jsonify({'success': True, 'message': 'Bot respondeu! Verifique o canal no Discord.'})
-        else:
-            return jsonify({'success': False, 'message': f'Bot retornou erro: {response.text}'}), 500
+        return jsonify({'success': True, 'message': 'Teste enviado para a fila do bot.', 'job_id': job_id}), 202
             
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# =====================================================
+# MODO GEVENT
+# =====================================================
+# Com SERVER_MODE=gevent (ver gunicorn.conf.py) cada requisição é uma
+# greenlet e esperas de rede (Discord, bot, SSE, long-poll) não ocupam
+# threads. As rotas abaixo só leem/gravam no SQLite, que bloquearia o
+# processo inteiro, então rodam no pool limitado de run_blocking. As demais
+# ficam na greenlet e mandam só o acesso ao banco para o pool: filas
+# (webhooks, jobs), config, versões das tabelas, eventos SSE e os streams
+# (iterate_blocking). Fora do gevent o wrapper só chama a view.
+SQLITE_ENDPOINTS = {
+    'get_stats', 'get_tickets', 'get_ticket', 'get_ticket_messages', 'search_messages',
+    'get_analytics', 'categories', 'category_detail', 'panels', 'get_job_status',
+}
+
+def _offload_view(view):
+    @wraps(view)
+    def offloaded(*args, **kwargs):
+        return run_blocking(view, *args, **kwargs)
+    return offloaded
+
+for _endpoint in SQLITE_ENDPOINTS:
+    app.view_functions[_endpoint] = _offload_view(app.view_functions[_endpoint])
+
 # =====================================================
 # INICIALIZAÇÃO
 # =====================================================
 # Inicializar banco de dados sempre
 init_db()
 
+# Medir as consultas só depois do schema (o DDL do init_db não interessa)
+set_query_observer(_observe_query)
+
+# Jobs em segundo plano só quando o app está servindo: comandos `flask ...`
+# também importam este módulo e não devem disputar o banco com os jobs.
+_background_jobs_pid = None
+_background_jobs_lock = native_lock()
+
+def start_background_jobs():
+    """Retoma jobs pendentes e agenda os periódicos (uma vez por processo)"""
+    global _background_jobs_pid
+    with _background_jobs_lock:
+        if _background_jobs_pid == os.getpid():
+            return
+        _background_jobs_pid = os.getpid()
+    job_queue.start()
+    schedule_archive_job()
+    schedule_analytics_job(delay=0)
+    schedule_session_job()
+    schedule_events_job()
+
+@app.before_request
+def _ensure_background_jobs():
+    # O Gunicorn já inicia no post_worker_init; isto cobre `flask run` e afins
+    if _background_jobs_pid != os.getpid():
+        start_background_jobs()
+
 if __name__ == '__main__':
     # Modo desenvolvimento (local)
     port = int(os.getenv('PORT', 5000))
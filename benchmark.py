@@ -0,0 +1,478 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Benchmark das APIs
+# Dados sintéticos, stubs do Discord e do bot, p50/p99 e resultados em JSON
+# =====================================================
+"""Benchmark reprodutível das rotas mais usadas do dashboard.
+
+Exemplos:
+    python benchmark.py --tickets 10000 --messages 100000 --output base.json
+    python benchmark.py --target gunicorn --server-mode gevent --compare base.json
+    python benchmark.py --tickets 1000000 --messages 10000000 --requests 2000
+
+O banco semeado fica em cache em --workdir (um arquivo por escala/semente);
+cada execução trabalha numa cópia, então as rodadas partem sempre dos
+mesmos dados. Discord e bot são servidores HTTP locais.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+GUILD_ID = '1365510151884378214'
+STAFF_ROLE = 1365634226254254150
+SECRET = 'benchmark'
+CATEGORIES = 8
+
+SESSION_ID = 'benchmark-session'
+
+SCENARIOS = (
+    'stats', 'tickets_open', 'tickets_closed', 'ticket', 'categories',
+    'webhook_created', 'webhook_message', 'webhook_messages_batch',
+)
+
+
+# =====================================================
+# STUBS (Discord e bot)
+# =====================================================
+class _StubHandler(BaseHTTPRequestHandler):
+    """Responde como a API do Discord (/api/v10/...) e como o bot (resto)"""
+
+    latency = 0.0
+
+    def _reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        time.sleep(self.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path.endswith('/channels'):
+            return self._reply([
+                {'id': str(900 + i), 'name': f'canal-{i}', 'type': 4 if i % 5 == 0 else 0, 'position': i}
+                for i in range(50)
+            ])
+        if path.endswith('/roles'):
+            return self._reply([
+                {'id': str(STAFF_ROLE + i), 'name': f'cargo-{i}', 'position': i, 'color': 0}
+                for i in range(30)
+            ])
+        if path == f'/api/v10/guilds/{GUILD_ID}':
+            return self._reply({'id': GUILD_ID, 'name': 'Benchmark', 'owner_id': '1'})
+        return self._reply({'message': 'Unknown'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        return self._reply({'success': True, 'message_id': '1'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency):
+    _StubHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# =====================================================
+# DADOS SINTÉTICOS
+# =====================================================
+def write_seed_files(workdir, tickets, messages, seed):
+    """Gera os CSVs de tickets e mensagens no formato do `flask import-tickets`"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+    tickets_path = os.path.join(workdir, 'seed_tickets.csv')
+    messages_path = os.path.join(workdir, 'seed_messages.csv')
+
+    created = []
+    with open(tickets_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('ticket_number', 'user_id', 'username', 'category_id', 'channel_id',
+                         'status', 'priority', 'assigned_to', 'created_at', 'closed_at'))
+        for number in range(1, tickets + 1):
+            opened = now - timedelta(seconds=rng.randrange(365 * 86400))
+            closed = rng.random() < 0.7
+            closed_at = min(now, opened + timedelta(seconds=rng.randrange(60, 7 * 86400))) if closed else None
+            user = rng.randrange(1, 50000)
+            writer.writerow((
+                number, user, f'user{user}', rng.randint(1, CATEGORIES), 10**17 + number,
+                'closed' if closed else 'open', rng.choice(('normal', 'normal', 'high', 'low')),
+                rng.randrange(1, 40) if rng.random() < 0.6 else '',
+                opened.isoformat(sep=' '), closed_at.isoformat(sep=' ') if closed_at else '',
+            ))
+            created.append(opened)
+
+    with open(messages_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('ticket_number', 'user_id', 'username', 'content', 'created_at'))
+        for _ in range(messages):
+            number = rng.randint(1, tickets)
+            at = min(now, created[number - 1] + timedelta(seconds=rng.randrange(3 * 86400)))
+            user = rng.randrange(1, 50000)
+            words = rng.choices(('olá', 'preciso', 'de', 'ajuda', 'com', 'minha', 'conta', 'pagamento',
+                                 'cargo', 'erro', 'obrigado', 'resolvido', 'staff', 'ticket'), k=rng.randint(3, 20))
+            writer.writerow((number, user, f'user{user}', ' '.join(words), at.isoformat(sep=' ')))
+    return tickets_path, messages_path
+
+
+def seed_database(app_module, workdir, args):
+    """Categorias + importação em massa dos arquivos gerados"""
+    with app_module.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO categories (name, emoji, description) VALUES (?, ?, ?)",
+            [(f'Categoria {i}', '🎫', f'Categoria sintética {i}') for i in range(1, CATEGORIES + 1)]
+        )
+        conn.commit()
+
+    started = time.perf_counter()
+    tickets_path, messages_path = write_seed_files(workdir, args.tickets, args.messages, args.seed)
+    print(f"   arquivos gerados em {time.perf_counter() - started:.1f}s")
+    try:
+        app_module.bulk_import(tickets_path, messages_path)
+    finally:
+        os.remove(tickets_path)
+        os.remove(messages_path)
+
+
+def add_bench_session(conn):
+    """Sessão de staff (SESSION_ID) usada por todas as requisições"""
+    from sessions import write_session      # só depois do os.environ (ver main)
+    write_session(conn, SESSION_ID, {
+        'user': {'id': '1', 'username': 'benchmark', 'discriminator': '0', 'avatar': None, 'roles': [STAFF_ROLE]},
+        'staff': True,
+    }, time.time() + 86400)
+    conn.commit()
+
+
+# =====================================================
+# EXECUÇÃO DOS CENÁRIOS
+# =====================================================
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def build_requests(max_ticket_id, max_ticket_number):
+    """Cenário -> função(rng) que devolve (método, caminho, json)"""
+    numbers = count(max_ticket_number + 1)
+
+    def message(rng):
+        return {'ticket_id': rng.randint(1, max_ticket_id), 'user_id': str(rng.randrange(1, 50000)),
+                'username': 'bench', 'content': 'mensagem do benchmark'}
+
+    return {
+        'stats': lambda rng: ('GET', '/api/stats', None),
+        'tickets_open': lambda rng: ('GET', '/api/tickets?status=open', None),
+        'tickets_closed': lambda rng: ('GET', '/api/tickets?status=closed&limit=100', None),
+        'ticket': lambda rng: ('GET', f'/api/ticket/{rng.randint(1, max_ticket_id)}', None),
+        'categories': lambda rng: ('GET', '/api/categories', None),
+        'webhook_created': lambda rng: ('POST', '/api/webhook/ticket-created', {
+            'ticket_number': next(numbers), 'user_id': str(rng.randrange(1, 50000)),
+            'username': 'bench', 'category_id': rng.randint(1, CATEGORIES)}),
+        'webhook_message': lambda rng: ('POST', '/api/webhook/ticket-message', message(rng)),
+        'webhook_messages_batch': lambda rng: ('POST', '/api/webhook/ticket-messages', {
+            'messages': [message(rng) for _ in range(50)]}),
+    }
+
+
+def run_scenario(send, make_request, total, concurrency, warmup, seed):
+    """Executa `total` requisições em `concurrency` threads; devolve as estatísticas"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(index, n):
+        rng = random.Random(seed * 1000 + index)
+        local, failed = [], 0
+        for _ in range(n):
+            method, path, body = make_request(rng)
+            started = time.perf_counter()
+            status = send(method, path, body)
+            local.append(time.perf_counter() - started)
+            if status >= 300 and status != 304:     # redirecionar p/ o login também é falha
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    for _ in range(warmup):
+        method, path, body = make_request(random.Random(seed))
+        send(method, path, body)
+
+    shares = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i, n) for i, n in enumerate(shares) if n]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def client_sender(app_module, cookie):
+    """Envia pelo test client do Flask (um client por thread)"""
+    local = threading.local()
+    auth = {'Authorization': f'Bearer {SECRET}'}
+
+    def send(method, path, body):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app_module.app.test_client()
+            client.set_cookie('session', cookie)
+        response = client.open(path, method=method, json=body, headers=auth)
+        response.get_data()
+        return response.status_code
+    return send
+
+
+def http_sender(base_url, cookie):
+    """Envia por HTTP de verdade (uma sessão keep-alive por thread)"""
+    import requests
+
+    local = threading.local()
+
+    def send(method, path, body):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.cookies.set('session', cookie)
+            session.headers['Authorization'] = f'Bearer {SECRET}'
+        response = session.request(method, base_url + path, json=body, timeout=60, allow_redirects=False)
+        return response.status_code
+    return send
+
+
+def run_all(send, requests_by_scenario, scenarios, args, label):
+    results = {}
+    for name in scenarios:
+        results[name] = run_scenario(send, requests_by_scenario[name], args.requests,
+                                     args.concurrency, args.warmup, args.seed)
+        r = results[name]
+        print(f"   [{label}] {name:<24} p50={r['p50_ms']:>8.2f}ms  p99={r['p99_ms']:>8.2f}ms  "
+              f"{r['rps']:>8.1f} req/s  erros={r['errors']}")
+    return results
+
+
+def start_gunicorn(args, db_path, stub_url):
+    port = free_port()
+    env = dict(os.environ, DATABASE_PATH=db_path, PORT=str(port), SERVER_MODE=args.server_mode,
+               WEB_CONCURRENCY=str(args.workers), DISCORD_API_URL=f'{stub_url}/api/v10', BOT_URL=stub_url)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '--log-level', 'warning'],
+        cwd=ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn terminou com código {process.returncode}')
+        try:
+            # Resposta HTTP = algum worker já passou pelo init_db
+            urllib.request.urlopen(f'{base_url}/login', timeout=2).close()
+            return process, base_url
+        except urllib.error.HTTPError:
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn não respondeu em 60s')
+
+
+# =====================================================
+# COMPARAÇÃO
+# =====================================================
+def compare(baseline, current, threshold):
+    """Imprime a variação de p50/p99/req/s e devolve quantas regressões houve"""
+    regressions = 0
+    print(f"\n📊 Comparação com a base (limite {threshold:.0f}%):")
+    for target, scenarios in current['results'].items():
+        for name, r in scenarios.items():
+            base = baseline.get('results', {}).get(target, {}).get(name)
+            if not base:
+                continue
+            changes = []
+            for key, worse_if_higher in (('p50_ms', True), ('p99_ms', True), ('rps', False)):
+                if not base[key]:
+                    continue
+                delta = (r[key] - base[key]) / base[key] * 100
+                regressed = delta > threshold if worse_if_higher else delta < -threshold
+                regressions += regressed
+                changes.append(f"{key}={delta:+6.1f}%{' ❌' if regressed else ''}")
+            print(f"   [{target}] {name:<24} " + '  '.join(changes))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# =====================================================
+# MAIN
+# =====================================================
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark das APIs do dashboard')
+    parser.add_argument('--tickets', type=int, default=10000, help='Tickets sintéticos (padrão 10k)')
+    parser.add_argument('--messages', type=int, default=100000, help='Mensagens sintéticas (padrão 100k)')
+    parser.add_argument('--seed', type=int, default=42, help='Semente dos dados e das requisições')
+    parser.add_argument('--target', choices=('client', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--server-mode', choices=('gthread', 'gevent'), default='gthread')
+    parser.add_argument('--workers', type=int, default=2, help='Workers do gunicorn')
+    parser.add_argument('--requests', type=int, default=500, help='Requisições por cenário')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requisições simultâneas')
+    parser.add_argument('--warmup', type=int, default=20, help='Requisições de aquecimento por cenário')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Lista separada por vírgulas')
+    parser.add_argument('--stub-latency', type=float, default=0.0,
+                        help='Latência simulada do Discord/bot em segundos')
+    parser.add_argument('--workdir', default=os.path.join(ROOT, 'bench_data'))
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='Variação (%%) considerada regressão no --compare')
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+    pristine = os.path.join(args.workdir, f'seed-{args.tickets}-{args.messages}-{args.seed}.db')
+    db_path = os.path.join(args.workdir, 'bench.db')
+    for suffix in ('', '-wal', '-shm'):
+        for path in (db_path, os.path.join(args.workdir, 'bench-gunicorn.db')):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    if os.path.exists(pristine):
+        shutil.copyfile(pristine, db_path)
+
+    # O app lê a configuração do ambiente na importação
+    stub_url = start_stub(args.stub_latency)
+    os.environ.update({
+        'DATABASE_PATH': db_path,
+        'ARCHIVE_DATABASE_PATH': os.path.join(args.workdir, 'bench_archive.db'),
+        'ARCHIVE_AFTER_DAYS': '0',
+        'ANALYTICS_INTERVAL': '0',
+        'METRICS_DIR': os.path.join(args.workdir, 'metrics'),
+        'DISCORD_API_URL': f'{stub_url}/api/v10',
+        'DISCORD_TOKEN': SECRET,
+        'GUILD_ID': GUILD_ID,
+        'BOT_URL': stub_url,
+        'SECRET_KEY': SECRET,
+        'DASHBOARD_SECRET': SECRET,
+    })
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    if not os.path.exists(pristine):
+        print(f"🌱 Semeando {args.tickets} tickets e {args.messages} mensagens...")
+        seed_database(app_module, args.workdir, args)
+        with app_module.get_db() as conn, sqlite3.connect(pristine) as target:
+            conn.backup(target)
+        print(f"✅ Banco semeado salvo em {pristine}")
+
+    with app_module.get_db() as conn:
+        max_ticket_id, max_ticket_number = conn.execute(
+            "SELECT MAX(id), MAX(ticket_number) FROM tickets").fetchone()
+    with app_module.get_db() as conn:
+        add_bench_session(conn)
+    cookie = SESSION_ID
+
+    report = {
+        'meta': {
+            'git': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'workdir')},
+        },
+        'results': {},
+    }
+
+    if args.target in ('client', 'both'):
+        print("🧪 Flask test client")
+        requests_by_scenario = build_requests(max_ticket_id, max_ticket_number)
+        report['results']['client'] = run_all(
+            client_sender(app_module, cookie), requests_by_scenario, args.scenarios, args, 'client')
+
+    if args.target in ('gunicorn', 'both'):
+        print(f"🚀 gunicorn ({args.server_mode}, {args.workers} workers)")
+        gunicorn_db = os.path.join(args.workdir, 'bench-gunicorn.db')
+        shutil.copyfile(pristine, gunicorn_db)     # mesmos dados iniciais do client
+        process, base_url = start_gunicorn(args, gunicorn_db, stub_url)
+        try:
+            # Depois do init_db dos workers (o banco semeado pode ser de um schema antigo)
+            with sqlite3.connect(gunicorn_db) as conn:
+                add_bench_session(conn)
+            requests_by_scenario = build_requests(max_ticket_id, max_ticket_number)
+            report['results']['gunicorn'] = run_all(
+                http_sender(base_url, cookie), requests_by_scenario, args.scenarios, args, 'gunicorn')
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"❌ {regressions} regressões acima de {args.threshold:.0f}%")
+            sys.exit(1)
+        print("✅ Nenhuma regressão")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@
 # =====================================================
 
 import aiohttp
+import asyncio
 import json
 
 # URL do dashboard (ajuste conforme seu deploy)
@@ -162,120 +163,160 @@ async def close(ctx):
         await close_ticket_on_dashboard(ticket_id)
 
 # =====================================================
-# WEBHOOK HANDLER NO DASHBOARD (app.py)
+# ENVIO EM LOTE (canais com muitas mensagens)
 # =====================================================
+async def register_ticket_messages_batch(messages):
+    """
+    Registra várias mensagens numa única requisição (até 1000 por lote)
 
-"""
-Adicione estas rotas no app.py do dashboard:
+    messages = [
+        {'ticket_id': 123, 'user_id': '1', 'username': 'João', 'content': 'Oi',
+         'attachments': [], 'created_at': '2025-10-05T22:00:00'},
+        ...
+    ]
+    """
+    async with aiohttp.ClientSession() as session:
+        try:
+            headers = {
+                'Content-Type': 'application/json',
+                'Authorization': f'Bearer {DASHBOARD_SECRET}'
+            }
+            
+            async with session.post(
+                f'{DASHBOARD_URL}/api/webhook/ticket-messages',
+                json={'messages': messages},
+                headers=headers
+            ) as response:
+                if response.status == 200:
+                    print(f"✅ {len(messages)} mensagens registradas no dashboard")
+        except Exception as e:
+            print(f"❌ Erro ao registrar mensagens: {e}")
 
-@app.route('/api/webhook/ticket-created', methods=['POST'])
-def webhook_ticket_created():
-    # Verificar autorização
-    auth = request.headers.get('Authorization')
-    if auth != f'Bearer {DASHBOARD_SECRET}':
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    data = request.json
-    
-    # Salvar no banco de dados
-    conn = sqlite3.connect('tickets.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO tickets (
-            ticket_number, user_id, username, category_id,
-            channel_id, status, created_at
-        ) VALUES (?, ?, ?, ?, ?, 'open', ?)
-    ''', (
-        data['ticket_number'],
-        data['user_id'],
-        data['username'],
-        data['category_id'],
-        data['channel_id'],
-        data['created_at']
-    ))
-    
-    ticket_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    
-    # Notificar via WebSocket
-    socketio.emit('ticket_created', {
-        'id': ticket_id,
-        'ticket_number': data['ticket_number'],
-        'username': data['username']
-    })
-    
-    return jsonify({'success': True, 'ticket_id': ticket_id})
+# =====================================================
+# ACOMPANHAR OS TOGGLES DO DASHBOARD (long-poll)
+# =====================================================
+async def watch_dashboard_config(on_change):
+    """
+    Fica esperando mudanças em /api/config/status e chama on_change(config)
 
-@app.route('/api/webhook/ticket-message', methods=['POST'])
-def webhook_ticket_message():
-    auth = request.headers.get('Authorization')
-    if auth != f'Bearer {DASHBOARD_SECRET}':
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    data = request.json
-    
-    # Salvar mensagem
-    conn = sqlite3.connect('tickets.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO ticket_messages (
-            ticket_id, user_id, username, content, attachments
-        ) VALUES (?, ?, ?, ?, ?)
-    ''', (
-        data['ticket_id'],
-        data['user_id'],
-        data['username'],
-        data['content'],
-        json.dumps(data.get('attachments', []))
-    ))
-    
-    # Atualizar contador de mensagens do ticket
-    c.execute('''
-        UPDATE tickets 
-        SET messages_count = messages_count + 1
-        WHERE id = ?
-    ''', (data['ticket_id'],))
-    
-    conn.commit()
-    conn.close()
-    
-    # Notificar via WebSocket
-    socketio.emit('ticket_update', {
-        'ticket_id': data['ticket_id'],
-        'new_message': True
-    })
-    
-    return jsonify({'success': True})
+    O dashboard segura a requisição até algum sistema ser ligado/desligado
+    (ou 50s passarem), então não é preciso fazer polling. O long-poll exige
+    o DASHBOARD_SECRET; se o dashboard já estiver com muitas esperas
+    abertas, responde 304 na hora com Retry-After.
+    """
+    etag = None
+    async with aiohttp.ClientSession() as session:
+        while True:
+            headers = {'Authorization': f'Bearer {DASHBOARD_SECRET}'}
+            if etag:
+                headers['If-None-Match'] = etag
+            try:
+                async with session.get(
+                    f'{DASHBOARD_URL}/api/config/status',
+                    params={'wait': 50},
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=60)
+                ) as response:
+                    if response.status == 200:
+                        etag = response.headers.get('ETag')
+                        await on_change(await response.json())
+                    elif response.headers.get('Retry-After'):
+                        await asyncio.sleep(int(response.headers['Retry-After']))
+            except Exception as e:
+                print(f"❌ Erro ao acompanhar config do dashboard: {e}")
+                await asyncio.sleep(5)
 
-@app.route('/api/webhook/ticket-closed', methods=['POST'])
-def webhook_ticket_closed():
-    auth = request.headers.get('Authorization')
-    if auth != f'Bearer {DASHBOARD_SECRET}':
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    data = request.json
-    
-    # Marcar como fechado
-    conn = sqlite3.connect('tickets.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        UPDATE tickets 
-        SET status = 'closed', closed_at = ?
-        WHERE id = ?
-    ''', (datetime.utcnow().isoformat(), data['ticket_id']))
-    
-    conn.commit()
-    conn.close()
-    
-    # Notificar via WebSocket
-    socketio.emit('ticket_update', {
-        'ticket_id': data['ticket_id'],
-        'status': 'closed'
-    })
-    
-    return jsonify({'success': True})
-"""
+# =====================================================
+# ROTAS DO BOT CHAMADAS PELO DASHBOARD
+# =====================================================
+# A fila de jobs do dashboard faz POST em BOT_URL com
+# Authorization: Bearer DASHBOARD_SECRET e refaz a entrega (com backoff) se a
+# resposta não for 2xx ou der timeout:
+#
+#   POST /send_panel       {'panel': {...}, 'categories': [{...}]}
+#                          -> {'message_id': '...'}
+#   POST /config_update    {'system': 'welcome', 'config': {...toggles...}}
+#                          -> {'success': True}
+#   POST /test_connection  {'channel_id': '...', 'message': '...'}
+#                          -> {'success': True}
+#
+# /send_panel vem com o cabeçalho Idempotency-Key, igual em todas as
+# tentativas do mesmo envio: responda com o message_id já publicado em vez de
+# postar o painel de novo.
+from collections import OrderedDict
+from aiohttp import web
+
+_panel_sends = OrderedDict()  # Idempotency-Key -> Task do envio
+
+def _dashboard_authorized(request):
+    return request.headers.get('Authorization') == f'Bearer {DASHBOARD_SECRET}'
+
+async def handle_send_panel(request):
+    """Publica o painel no canal (panel['channel_id']) uma vez por Idempotency-Key"""
+    if not _dashboard_authorized(request):
+        return web.json_response({'error': 'Não autorizado'}, status=401)
+    data = await request.json()
+    key = request.headers.get('Idempotency-Key')
+
+    task = _panel_sends.get(key) if key else None
+    if task is None:
+        task = asyncio.ensure_future(publish_panel(data['panel'], data['categories']))  # Sua função
+        if key:
+            _panel_sends[key] = task
+            while len(_panel_sends) > 1000:
+                _panel_sends.popitem(last=False)
+    try:
+        # shield: se o dashboard desistir (timeout), o envio continua e a
+        # próxima tentativa recebe o mesmo message_id
+        message = await asyncio.shield(task)
+    except Exception as e:
+        _panel_sends.pop(key, None)
+        return web.json_response({'error': str(e)}, status=500)
+    return web.json_response({'message_id': str(message.id)})
+
+async def handle_config_update(request):
+    """Aplica os toggles de um sistema (welcome, goodbye, autorole, tickets)"""
+    if not _dashboard_authorized(request):
+        return web.json_response({'error': 'Não autorizado'}, status=401)
+    data = await request.json()
+    apply_system_config(data['system'], data['config'])  # Sua função
+    return web.json_response({'success': True})
+
+async def handle_test_connection(request):
+    """Manda a mensagem de teste no canal pedido"""
+    if not _dashboard_authorized(request):
+        return web.json_response({'error': 'Não autorizado'}, status=401)
+    data = await request.json()
+    channel = bot.get_channel(int(data['channel_id']))
+    if channel is None:
+        return web.json_response({'error': 'Canal não encontrado'}, status=404)
+    await channel.send(data.get('message') or '🧪 Teste de conexão Dashboard → Bot')
+    return web.json_response({'success': True})
+
+bot_api = web.Application()
+bot_api.router.add_post('/send_panel', handle_send_panel)
+bot_api.router.add_post('/config_update', handle_config_update)
+bot_api.router.add_post('/test_connection', handle_test_connection)
+# Rode junto com o bot, ex: no setup_hook:
+#   runner = web.AppRunner(bot_api); await runner.setup()
+#   await web.TCPSite(runner, '0.0.0.0', int(os.getenv('PORT', 8080))).start()
+
+# =====================================================
+# WEBHOOKS NO DASHBOARD (app.py)
+# =====================================================
+#
+# O dashboard já implementa estas rotas (configure DASHBOARD_SECRET com o
+# mesmo valor nos dois serviços):
+#
+#   POST /api/webhook/ticket-created   -> {'success': True, 'ticket_id': id}
+#   POST /api/webhook/ticket-message   -> {'success': True}
+#   POST /api/webhook/ticket-messages  -> {'success': True, 'count': n}  (lote)
+#   POST /api/webhook/ticket-closed    -> {'success': True, 'closed': bool}
+#
+# Use o ticket_id devolvido por ticket-created nas mensagens e no fechamento.
+# ids e ticket_number vão como números; campos com tipo errado dão 400 e
+# mensagens para um ticket_id que não existe dão 404 (o lote inteiro é
+# recusado, listando os ticket_ids desconhecidos).
+# As gravações são agrupadas numa fila de escrita: mensagens que chegam ao
+# mesmo tempo viram um único COMMIT, e o dashboard é avisado em tempo real
+# pelo /api/events.
@@ -0,0 +1,94 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Cache em memória
+# TTL + stale-while-revalidate + single-flight
+# =====================================================
+
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _Entry:
+    __slots__ = ('value', 'fresh_until', 'stale_until')
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """Cache por processo para dados remotos que mudam pouco (ex: API do Discord).
+
+    - Até `ttl` segundos o valor é servido direto do cache.
+    - Entre `ttl` e `ttl + stale_ttl` o valor antigo é servido imediatamente
+      e uma thread em segundo plano busca o novo (stale-while-revalidate).
+    - Depois disso, ou sem valor, a requisição espera a busca.
+    - Buscas simultâneas da mesma chave são unificadas (single-flight): só
+      uma chamada ao `loader` acontece, as outras aguardam o mesmo resultado.
+    """
+
+    def __init__(self, ttl=300, stale_ttl=3600):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._generation = 0
+
+    def get(self, key, loader):
+        """Retorna o valor de `key`, chamando `loader()` se necessário"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.fresh_until:
+                return entry.value
+
+            if entry is not None and now < entry.stale_until:
+                if key not in self._inflight:
+                    flight = self._start_flight(key)
+                    threading.Thread(
+                        target=self._load, args=(key, loader, flight), daemon=True
+                    ).start()
+                return entry.value
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._start_flight(key)
+
+        if leader:
+            self._load(key, loader, flight)
+        return flight.result()
+
+    def _start_flight(self, key):
+        flight = Future()
+        flight.generation = self._generation
+        self._inflight[key] = flight
+        return flight
+
+    def _load(self, key, loader, flight):
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.set_exception(e)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._inflight.pop(key, None)
+            # Não grava se o cache foi invalidado durante a busca
+            if flight.generation == self._generation:
+                self._entries[key] = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        flight.set_result(value)
+
+    def invalidate(self, key=None):
+        """Remove `key` (ou tudo, se None); a próxima leitura busca de novo"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
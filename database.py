@@ -0,0 +1,397 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Camada de Banco de Dados
+# Pool de conexões SQLite (WAL) compartilhado por todas as rotas
+# =====================================================
+
+import contextvars
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+# =====================================================
+# CONFIGURAÇÕES
+# =====================================================
+DB_PATH = os.getenv('DATABASE_PATH', 'tickets.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 20000))         # ~20 MB por conexão
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 128 * 1024 * 1024))     # 128 MB
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')               # NORMAL é seguro em WAL
+
+
+def _original(module, name):
+    """Objeto original da stdlib, mesmo com o monkey-patching do gevent ativo"""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None:
+        return monkey.get_original(module, name)
+    return getattr(sys.modules[module], name)
+
+
+def native_lock():
+    """Lock de thread de verdade: seguro entre greenlets e as threads de run_blocking"""
+    return _original('threading', 'Lock')()
+
+
+# =====================================================
+# MEDIÇÃO DE CONSULTAS
+# =====================================================
+# Se definido (set_query_observer), recebe (conexão, sql, parâmetros,
+# segundos) de cada execute; no executemany os parâmetros vão como None.
+# O tempo vai até a primeira linha do resultado; o fetch fica de fora.
+_query_observer = None
+
+
+def set_query_observer(observer):
+    global _query_observer
+    _query_observer = observer
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if _query_observer is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _query_observer(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _query_observer is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _query_observer(self.connection, sql, None, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Conexão cujos cursores medem cada execute (ver set_query_observer)"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute do sqlite3 não passa por cursor(): redireciona
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _configure(conn):
+    """Aplica os PRAGMAs de desempenho numa conexão nova"""
+    conn.row_factory = sqlite3.Row
+    # Só vale para banco recém-criado; bancos antigos: flask vacuum-db
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _connect(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # a conexão circula entre threads via pool
+        factory=TimedConnection,
+    )
+    return _configure(conn)
+
+
+# =====================================================
+# POOL DE CONEXÕES
+# =====================================================
+class ConnectionPool:
+    """Pool simples de conexões SQLite, um por processo (worker do Gunicorn).
+
+    As conexões são criadas sob demanda até `size` e devolvidas ao pool ao
+    final de cada uso. Se o processo fizer fork (Gunicorn pré-carregando o
+    app), o filho descarta o pool herdado e cria suas próprias conexões.
+    Usa lock e fila nativos porque, no modo gevent, o pool é compartilhado
+    entre greenlets e as threads de run_blocking.
+    """
+
+    def __init__(self, path=DB_PATH, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._lock = native_lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = _original('queue', 'SimpleQueue')()
+        self._created = 0
+
+    def _acquire(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return _connect(self.path)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        # Pool cheio: aguarda uma conexão ser devolvida
+        return self._idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+
+    def _release(self, conn):
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool.
+
+        Transações abertas e não confirmadas são desfeitas ao devolver a
+        conexão, para que ela volte limpa ao pool.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._release(conn)
+
+    def close_all(self):
+        """Fecha todas as conexões ociosas (usado em testes/encerramento)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+pool = ConnectionPool()
+
+# Banco separado para tickets fechados arquivados (ver ARQUIVAMENTO no app.py)
+ARCHIVE_PATH = os.getenv('ARCHIVE_DATABASE_PATH', 'tickets_archive.db')
+archive_pool = ConnectionPool(ARCHIVE_PATH, size=2)
+
+
+def get_db():
+    """Atalho: `with get_db() as conn:` empresta uma conexão do pool padrão"""
+    return pool.connection()
+
+
+def get_archive_db():
+    """Atalho para o pool do banco de arquivo"""
+    return archive_pool.connection()
+
+
+@contextmanager
+def read_snapshot(path=DB_PATH):
+    """Conexão somente leitura, fora do pool, presa a um snapshot do banco.
+
+    Para leituras longas (exportações): em WAL, a transação de leitura vê o
+    banco como estava na abertura e não bloqueia as escritas. Enquanto ela
+    durar, o checkpoint não avança além do snapshot (o WAL cresce).
+    """
+    uri = Path(path).absolute().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False, factory=TimedConnection)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")   # fixa o snapshot agora
+        yield conn
+    finally:
+        conn.close()
+
+
+# =====================================================
+# MODO GEVENT (gunicorn -k gevent)
+# =====================================================
+# Com o gevent, esperas de rede viram trocas de greenlet, mas uma chamada ao
+# SQLite bloqueia o processo inteiro. run_blocking manda esse trabalho para
+# um pool limitado de threads de verdade; fora do gevent executa direto.
+DB_OFFLOAD_THREADS = int(os.getenv('DB_OFFLOAD_THREADS', DB_POOL_SIZE))
+
+_offload_pool = None
+_offload_pid = None
+_offload_local = threading.local()
+
+
+def gevent_active():
+    """True se o processo roda com o monkey-patching do gevent"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def _run_offloaded(fn, args, kwargs):
+    _offload_local.active = True
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _offload_local.active = False
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Executa `fn` numa thread do pool de offload (no gevent) e espera o resultado
+
+    O contexto (request/sessão do Flask) é copiado para a thread. Chamadas
+    feitas de dentro do pool executam direto, sem reenfileirar.
+    """
+    global _offload_pool, _offload_pid
+    if not gevent_active() or getattr(_offload_local, 'active', False):
+        return fn(*args, **kwargs)
+    if _offload_pool is None or _offload_pid != os.getpid():
+        from gevent.threadpool import ThreadPool
+        _offload_pool, _offload_pid = ThreadPool(DB_OFFLOAD_THREADS), os.getpid()
+    context = contextvars.copy_context()
+    return _offload_pool.apply(context.run, (_run_offloaded, fn, args, kwargs))
+
+
+def iterate_blocking(iterable):
+    """Itera `iterable` fazendo cada next() por run_blocking (geradores que leem o SQLite)
+
+    Para respostas em streaming: o gerador avança numa thread do pool e a
+    greenlet só espera. Ao fechar, o close() (e os finally do gerador) também
+    rodam lá. Fora do gevent devolve o próprio iterável.
+    """
+    if not gevent_active():
+        return iterable
+    return _iterate_offloaded(iter(iterable))
+
+
+def _iterate_offloaded(iterator):
+    done = object()
+    try:
+        while True:
+            item = run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            run_blocking(close)
+
+
+# =====================================================
+# FILA DE ESCRITA (group commit)
+# =====================================================
+WRITE_BATCH_MAX = int(os.getenv('WRITE_BATCH_MAX', 500))
+WRITE_BATCH_DELAY_MS = float(os.getenv('WRITE_BATCH_DELAY_MS', 10))
+
+
+class WriteQueue:
+    """Agrupa escritas de várias requisições numa única transação.
+
+    Cada `submit(op, payload)` devolve um Future. Uma thread por processo
+    junta o que chegou (até `max_batch` itens, esperando no máximo
+    `delay_ms` depois do primeiro), chama `handlers[op](conn, payloads)` uma
+    vez para cada sequência consecutiva da mesma operação e faz um único
+    COMMIT. Os Futures só são resolvidos depois do COMMIT, então quem espera
+    o resultado tem a mesma garantia de durabilidade de uma escrita direta.
+
+    Se o lote falhar, ele é desfeito e os itens são reprocessados um a um,
+    para que um payload inválido não derrube os outros.
+    """
+
+    def __init__(self, handlers, pool=None, max_batch=WRITE_BATCH_MAX, delay_ms=WRITE_BATCH_DELAY_MS):
+        self.handlers = handlers
+        self.pool = pool
+        self.max_batch = max_batch
+        self.delay = delay_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, op, payload):
+        if op not in self.handlers:
+            raise ValueError(f'Operação de escrita desconhecida: {op}')
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((op, payload, future))
+        return future
+
+    def submit_many(self, op, payloads):
+        return [self.submit(op, payload) for payload in payloads]
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = run_blocking(self._apply, batch)
+            except Exception:
+                # Lote falhou: isola cada item na sua própria transação
+                for item in batch:
+                    try:
+                        result = run_blocking(self._apply, [item])[0]
+                    except Exception as e:
+                        item[2].set_exception(e)
+                    else:
+                        item[2].set_result(result)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _apply(self, batch):
+        """Executa o lote numa transação; retorna um resultado por item"""
+        results = []
+        with (self.pool or pool).connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            start = 0
+            while start < len(batch):
+                op = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == op:
+                    end += 1
+                payloads = [payload for _, payload, _ in batch[start:end]]
+                results.extend(self.handlers[op](conn, payloads))
+                start = end
+            conn.commit()
+        return results
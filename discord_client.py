@@ -0,0 +1,247 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Cliente REST do Discord
+# Sessão HTTP persistente, timeouts, buckets de rate limit e retries
+# =====================================================
+
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DISCORD_API_URL = 'https://discord.com/api/v10'
+
+DISCORD_CONNECT_TIMEOUT = float(os.getenv('DISCORD_CONNECT_TIMEOUT', 3.05))
+DISCORD_READ_TIMEOUT = float(os.getenv('DISCORD_READ_TIMEOUT', 10))
+DISCORD_MAX_RETRIES = int(os.getenv('DISCORD_MAX_RETRIES', 3))
+DISCORD_MAX_RATELIMIT_WAIT = float(os.getenv('DISCORD_MAX_RATELIMIT_WAIT', 10))
+DISCORD_POOL_SIZE = int(os.getenv('DISCORD_POOL_SIZE', 10))
+
+# IDs na rota que definem buckets separados ("major parameters" do Discord)
+_MAJOR_PARAM = re.compile(r'^/(guilds|channels|webhooks)/(\d+)')
+_SNOWFLAKE = re.compile(r'/\d{15,}')
+
+
+class DiscordAPIError(Exception):
+    """Resposta de erro (ou falha de rede) ao falar com a API do Discord"""
+
+    def __init__(self, message, status=None, response=None):
+        super().__init__(message)
+        self.status = status
+        self.response = response
+
+
+class DiscordRateLimited(DiscordAPIError):
+    """O rate limit exigiria esperar mais do que DISCORD_MAX_RATELIMIT_WAIT"""
+
+
+class _Bucket:
+    __slots__ = ('remaining', 'reset_at')
+
+    def __init__(self):
+        self.remaining = None
+        self.reset_at = 0.0
+
+
+class DiscordClient:
+    """Cliente HTTP da API do Discord compartilhado por todo o processo.
+
+    - Reaproveita conexões keep-alive (uma sessão `requests` com pool).
+    - Aplica timeout de conexão/leitura em toda chamada.
+    - Lê os cabeçalhos X-RateLimit-* e, quando um bucket está esgotado,
+      espera o reset antes de enviar a próxima chamada em vez de tomar 429.
+    - Em 429 espera `retry_after`; em erro 5xx/rede (só GET) tenta de novo
+      com backoff exponencial e jitter, até `max_retries` vezes.
+    """
+
+    def __init__(self, base_url=DISCORD_API_URL, bot_token='', timeout=None,
+                 max_retries=DISCORD_MAX_RETRIES, max_ratelimit_wait=DISCORD_MAX_RATELIMIT_WAIT):
+        self.base_url = base_url
+        self.bot_token = bot_token
+        self.timeout = timeout or (DISCORD_CONNECT_TIMEOUT, DISCORD_READ_TIMEOUT)
+        self.max_retries = max_retries
+        self.max_ratelimit_wait = max_ratelimit_wait
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=DISCORD_POOL_SIZE, pool_maxsize=DISCORD_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = 'DiscordBot (caos-ticket-dashboard, 1.0)'
+
+        self._lock = threading.Lock()
+        self._route_buckets = {}   # rota -> hash do bucket informado pelo Discord
+        self._buckets = {}         # (hash, major, credencial) -> _Bucket
+        self._global_reset_at = 0.0
+
+        # Se definido, recebe (rota, status, segundos, segundos em rate limit)
+        # ao final de cada chamada, incluindo retries e esperas
+        self.observer = None
+
+    # -------------------------------------------------
+    # Rate limit
+    # -------------------------------------------------
+    @staticmethod
+    def _route(method, path):
+        """Chave da rota: método + caminho com IDs genéricos, exceto o major"""
+        match = _MAJOR_PARAM.match(path)
+        major = match.group(2) if match else ''
+        generic = _SNOWFLAKE.sub('/{id}', path[match.end():] if match else path)
+        prefix = f'/{match.group(1)}/{{major}}' if match else ''
+        return f'{method} {prefix}{generic}', major
+
+    def _bucket_key(self, route, major, credential):
+        bucket_hash = self._route_buckets.get(route, route)
+        return (bucket_hash, major, credential)
+
+    def _wait_for_bucket(self, key):
+        """Dorme até o bucket (e o limite global) liberarem uma chamada"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._global_reset_at - now)
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket.remaining == 0 and bucket.reset_at > now:
+                wait = max(wait, bucket.reset_at - now)
+            elif bucket is not None and bucket.remaining:
+                # Reserva a vaga para chamadas concorrentes da mesma thread-pool
+                bucket.remaining -= 1
+
+        if wait > self.max_ratelimit_wait:
+            raise DiscordRateLimited(f'Rate limit do Discord: aguarde {wait:.1f}s', status=429)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _update_bucket(self, route, major, credential, response):
+        headers = response.headers
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if bucket_hash is None or remaining is None or reset_after is None:
+            return
+
+        with self._lock:
+            self._route_buckets[route] = bucket_hash
+            key = (bucket_hash, major, credential)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) > 1000:
+                    self._prune_buckets()
+                bucket = self._buckets[key] = _Bucket()
+            bucket.remaining = int(remaining)
+            bucket.reset_at = time.monotonic() + float(reset_after)
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if b.reset_at < now]:
+            del self._buckets[key]
+
+    def _handle_429(self, route, major, credential, response):
+        """Registra o 429 e retorna quantos segundos esperar"""
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        retry_after = float(body.get('retry_after') or response.headers.get('Retry-After') or 1)
+
+        with self._lock:
+            reset_at = time.monotonic() + retry_after
+            if body.get('global') or response.headers.get('X-RateLimit-Global'):
+                self._global_reset_at = reset_at
+            else:
+                bucket = self._buckets.setdefault(
+                    self._bucket_key(route, major, credential), _Bucket())
+                bucket.remaining = 0
+                bucket.reset_at = reset_at
+        return retry_after
+
+    # -------------------------------------------------
+    # Chamadas
+    # -------------------------------------------------
+    def request(self, method, path, token=None, token_type='Bot', **kwargs):
+        """Faz uma chamada à API e retorna o `requests.Response`.
+
+        `path` é relativo à base da API (ex: '/guilds/123/roles'). Por padrão
+        autentica com o token do bot; use `token`/`token_type='Bearer'` para
+        chamadas em nome do usuário, ou `token_type=None` para não autenticar.
+        Levanta DiscordAPIError em falha de rede depois dos retries.
+        """
+        method = method.upper()
+        headers = dict(kwargs.pop('headers', None) or {})
+        credential = ''
+        if token_type:
+            token = token or self.bot_token
+            headers['Authorization'] = f'{token_type} {token}'
+            credential = token_type if token_type == 'Bot' else str(hash(token))
+        kwargs.setdefault('timeout', self.timeout)
+
+        route, major = self._route(method, path)
+        started = time.perf_counter()
+        timing = {'status': 'error', 'waited': 0.0}
+        try:
+            return self._send(method, path, route, major, credential, headers, kwargs, timing)
+        except DiscordRateLimited:
+            timing['status'] = 429
+            raise
+        finally:
+            if self.observer is not None:
+                self.observer(route, timing['status'], time.perf_counter() - started, timing['waited'])
+
+    def _send(self, method, path, route, major, credential, headers, kwargs, timing):
+        """Laço de envio com esperas de rate limit e retries (ver request)"""
+        attempt = 0
+        while True:
+            with self._lock:
+                key = self._bucket_key(route, major, credential)
+            timing['waited'] += self._wait_for_bucket(key)
+
+            try:
+                response = self.session.request(method, f'{self.base_url}{path}', headers=headers, **kwargs)
+            except requests.RequestException as e:
+                if method != 'GET' or attempt >= self.max_retries:
+                    raise DiscordAPIError(f'Falha ao acessar o Discord: {e}') from e
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self._update_bucket(route, major, credential, response)
+            timing['status'] = response.status_code
+
+            if response.status_code == 429 and attempt < self.max_retries:
+                retry_after = self._handle_429(route, major, credential, response)
+                if retry_after > self.max_ratelimit_wait:
+                    raise DiscordRateLimited(
+                        f'Rate limit do Discord: aguarde {retry_after:.1f}s', status=429, response=response)
+                attempt += 1
+                delay = retry_after + random.uniform(0, 0.25)
+                time.sleep(delay)
+                timing['waited'] += delay
+                continue
+
+            if response.status_code >= 500 and method == 'GET' and attempt < self.max_retries:
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+                continue
+
+            return response
+
+    @staticmethod
+    def _backoff(attempt):
+        """Backoff exponencial com jitter total: 0..(0,5 * 2^tentativa) segundos"""
+        return random.uniform(0, 0.5 * (2 ** attempt))
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def get_json(self, path, **kwargs):
+        """GET que retorna o JSON ou levanta DiscordAPIError se status != 200"""
+        response = self.get(path, **kwargs)
+        if response.status_code != 200:
+            raise DiscordAPIError(
+                f'{path}: HTTP {response.status_code}', status=response.status_code, response=response)
+        return response.json()
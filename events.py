@@ -0,0 +1,63 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Eventos em tempo real
+# Pub/sub em memória + formatação Server-Sent Events
+# =====================================================
+
+import json
+import queue
+import threading
+
+
+class EventBus:
+    """Fan-out de eventos para todas as conexões SSE deste processo.
+
+    Cada assinante recebe uma fila própria e limitada; se um cliente lento
+    deixar a fila encher, os eventos mais antigos dele são descartados (o
+    dashboard só usa os eventos para saber *quando* atualizar).
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event, data, event_id=None):
+        """Entrega (event_id, event, data) a todos os assinantes"""
+        item = (event_id, event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            while True:
+                try:
+                    q.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+def format_sse(event_id, event, data):
+    """Serializa um evento no formato text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False, default=str)}')
+    return '\n'.join(lines) + '\n\n'
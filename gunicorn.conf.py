@@ -0,0 +1,32 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Configuração do Gunicorn
+# SERVER_MODE=gthread (padrão) ou gevent
+# =====================================================
+# gthread: cada requisição ocupa uma thread; o limite de requisições
+#          simultâneas é workers x threads.
+# gevent:  cada requisição é uma greenlet; esperas no Discord, no bot, no
+#          SSE e no long-poll não ocupam threads, e o SQLite roda num pool
+#          limitado (DB_OFFLOAD_THREADS). Requer o pacote gevent e não pode
+#          ser usado com --preload (o monkey-patching precisa vir antes do app).
+
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'gthread')
+
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+if SERVER_MODE == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('GEVENT_WORKER_CONNECTIONS', 500))
+else:
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', 32))
+
+
+def post_worker_init(worker):
+    # Jobs em segundo plano (fila do bot, arquivamento, analytics) só nos
+    # workers; comandos `flask ...` importam o app sem iniciá-los.
+    from app import start_background_jobs
+    start_background_jobs()
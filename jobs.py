@@ -0,0 +1,230 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Fila de jobs persistente
+# Entregas ao bot em segundo plano, com retries e backoff
+# =====================================================
+
+import json
+import os
+import random
+import threading
+import time
+
+from database import get_db, native_lock, run_blocking
+
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 2))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 6))
+JOBS_LEASE_SECONDS = int(os.getenv('JOBS_LEASE_SECONDS', 120))
+JOBS_BACKOFF_BASE = float(os.getenv('JOBS_BACKOFF_BASE', 5))
+JOBS_BACKOFF_MAX = float(os.getenv('JOBS_BACKOFF_MAX', 600))
+JOBS_RETENTION = '-7 days'
+
+CLAIM_JOB_QUERY = """
+    UPDATE bot_jobs
+    SET status = 'running', attempts = attempts + 1, locked_until = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM bot_jobs
+        WHERE (status = 'pending' AND next_run_at <= ?)
+           OR (status = 'running' AND locked_until < ?)
+        ORDER BY next_run_at
+        LIMIT 1
+    )
+    RETURNING id, kind, payload, attempts, max_attempts
+"""
+
+
+def create_jobs_table(conn):
+    """Cria a tabela de jobs (chamado pelo init_db)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS bot_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        next_run_at REAL NOT NULL,
+        locked_until REAL,
+        last_error TEXT,
+        result TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bot_jobs_due
+        ON bot_jobs (status, next_run_at)''')
+
+
+class JobQueue:
+    """Fila de jobs gravada no SQLite e processada por uma thread por worker.
+
+    `enqueue` grava o job e retorna o id na hora; a thread pega o próximo job
+    vencido com um UPDATE ... RETURNING atômico (seguro com vários workers
+    do Gunicorn), chama o handler e grava o resultado. Em erro, o job volta
+    para 'pending' com backoff exponencial + jitter até `max_attempts`, depois
+    fica 'failed'. Enquanto o handler roda, o lease é renovado a cada terço
+    de JOBS_LEASE_SECONDS, então jobs longos (ex: o primeiro arquivamento)
+    não são pegos por outro worker; jobs 'running' de um worker que morreu
+    voltam à fila quando o lease expira. Todo acesso ao banco passa por
+    run_blocking (modo gevent).
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self._wakeup = threading.Event()
+        self._lock = native_lock()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, kind, payload, max_attempts=JOBS_MAX_ATTEMPTS):
+        if kind not in self.handlers:
+            raise ValueError(f'Tipo de job desconhecido: {kind}')
+        job_id = run_blocking(self._insert, kind, payload, max_attempts)
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    @staticmethod
+    def _insert(kind, payload, max_attempts):
+        with get_db() as conn:
+            job_id = conn.execute(
+                "INSERT INTO bot_jobs (kind, payload, max_attempts, next_run_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), max_attempts, time.time())
+            ).lastrowid
+            conn.commit()
+        return job_id
+
+    def schedule_unique(self, kind, payload, delay=0, max_attempts=JOBS_MAX_ATTEMPTS):
+        """Agenda `kind` para daqui a `delay` segundos, se ainda não houver um
+        job desse tipo pendente (atômico entre workers). Retorna o id ou None."""
+        if kind not in self.handlers:
+            raise ValueError(f'Tipo de job desconhecido: {kind}')
+        job_id = run_blocking(self._insert_unique, kind, payload, delay, max_attempts)
+        self.start()
+        return job_id
+
+    @staticmethod
+    def _insert_unique(kind, payload, delay, max_attempts):
+        with get_db() as conn:
+            cursor = conn.execute(
+                "INSERT INTO bot_jobs (kind, payload, max_attempts, next_run_at) "
+                "SELECT ?, ?, ?, ? WHERE NOT EXISTS ("
+                "SELECT 1 FROM bot_jobs WHERE kind = ? AND status = 'pending')",
+                (kind, json.dumps(payload), max_attempts, time.time() + delay, kind)
+            )
+            conn.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def get(self, job_id):
+        """Estado de um job como dict, ou None"""
+        return run_blocking(self._load, job_id)
+
+    @staticmethod
+    def _load(job_id):
+        with get_db() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, attempts, max_attempts, last_error, result, "
+                "created_at, updated_at FROM bot_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def start(self):
+        """Inicia a thread de processamento deste processo (idempotente)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _claim(self):
+        now = time.time()
+        with get_db() as conn:
+            row = conn.execute(CLAIM_JOB_QUERY, (now + JOBS_LEASE_SECONDS, now, now)).fetchone()
+            conn.commit()
+        return row
+
+    @staticmethod
+    def _renew_lease(job_id):
+        with get_db() as conn:
+            conn.execute(
+                "UPDATE bot_jobs SET locked_until = ? WHERE id = ? AND status = 'running'",
+                (time.time() + JOBS_LEASE_SECONDS, job_id)
+            )
+            conn.commit()
+
+    def _keep_lease(self, job_id, done):
+        while not done.wait(JOBS_LEASE_SECONDS / 3):
+            try:
+                run_blocking(self._renew_lease, job_id)
+            except Exception as e:
+                print(f"⚠️ Erro ao renovar o lease do job #{job_id}: {e}")
+
+    def _finish(self, job_id, status, result=None, error=None, next_run_at=None):
+        with get_db() as conn:
+            conn.execute(
+                "UPDATE bot_jobs SET status = ?, result = ?, last_error = ?, "
+                "next_run_at = COALESCE(?, next_run_at), locked_until = NULL, "
+                "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                # default=str: um resultado que não é JSON não pode travar o job em 'running'
+                (status, json.dumps(result, default=str) if result is not None else None,
+                 error, next_run_at, job_id)
+            )
+            conn.commit()
+
+    def _prune(self):
+        with get_db() as conn:
+            conn.execute(
+                "DELETE FROM bot_jobs WHERE status IN ('done', 'failed') "
+                "AND updated_at < datetime('now', ?)", (JOBS_RETENTION,)
+            )
+            conn.commit()
+
+    def _run(self):
+        last_prune = 0.0
+        while True:
+            try:
+                job = run_blocking(self._claim)
+            except Exception as e:
+                print(f"❌ Erro ao buscar jobs: {e}")
+                job = None
+
+            if job is None:
+                if time.monotonic() - last_prune > 3600:
+                    try:
+                        run_blocking(self._prune)
+                    except Exception as e:
+                        print(f"❌ Erro ao limpar jobs: {e}")
+                    last_prune = time.monotonic()
+                self._wakeup.wait(JOBS_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._execute(job)
+            except Exception as e:
+                # Ex: banco travado ao gravar o resultado; o lease expira e o
+                # job volta à fila, mas a thread continua viva
+                print(f"❌ Erro ao finalizar job #{job['id']} ({job['kind']}): {e}")
+
+    def _execute(self, job):
+        done = threading.Event()
+        threading.Thread(target=self._keep_lease, args=(job['id'], done), daemon=True).start()
+        try:
+            result = run_blocking(self.handlers[job['kind']], json.loads(job['payload']))
+        except Exception as e:
+            done.set()
+            error = str(e)[:500]
+            if job['attempts'] >= job['max_attempts']:
+                print(f"❌ Job #{job['id']} ({job['kind']}) falhou de vez: {error}")
+                run_blocking(self._finish, job['id'], 'failed', error=error)
+            else:
+                delay = min(JOBS_BACKOFF_MAX, JOBS_BACKOFF_BASE * 2 ** (job['attempts'] - 1))
+                delay = random.uniform(delay / 2, delay)
+                print(f"⚠️ Job #{job['id']} ({job['kind']}) falhou, nova tentativa em {delay:.0f}s: {error}")
+                run_blocking(self._finish, job['id'], 'pending', error=error, next_run_at=time.time() + delay)
+            return
+
+        done.set()
+        run_blocking(self._finish, job['id'], 'done', result=result)
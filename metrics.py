@@ -0,0 +1,179 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Métricas (formato Prometheus)
+# Histogramas e contadores por processo, somados entre os workers
+# =====================================================
+
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from database import native_lock
+
+# Cada worker grava um snapshot em METRICS_DIR/<pid>.json; o /metrics soma
+# os arquivos de todos os workers do mesmo master (inclusive os que já
+# morreram, para que os contadores não voltem para trás)
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(
+    tempfile.gettempdir(), f'caos-metrics-{os.getppid()}')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class Histogram:
+    """Histograma com rótulos; guarda contagens por bucket, soma e total"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._lock = native_lock()
+        self._series = {}   # rótulos -> [contagens por bucket (+Inf no fim), soma]
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), list(counts), total] for labels, (counts, total) in self._series.items()]
+
+    @staticmethod
+    def merge(into, value):
+        counts, total = into or ([0] * len(value[0]), 0.0)
+        return [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+
+    def render(self, series):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), labels + (str(bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {total:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Contador com rótulos"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = native_lock()
+        self._series = {}
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._series.items()]
+
+    @staticmethod
+    def merge(into, value):
+        return (into or 0) + value
+
+    def render(self, series):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(series.items()):
+            lines.append(f'{self.name}{_labels(self.labels, labels)} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Registry:
+    """Conjunto de métricas do processo + snapshot em disco para o /metrics"""
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._flushed_at = 0.0
+
+    def histogram(self, name, help, labels=(), buckets=HTTP_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help, tuple(labels), buckets))
+
+    def counter(self, name, help, labels=()):
+        return self._metrics.setdefault(name, Counter(name, help, tuple(labels)))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def maybe_flush(self):
+        """Grava o snapshot deste processo se o último tiver mais de flush_interval segundos"""
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Erro ao gravar métricas: {e}")
+
+    def render(self):
+        """Todas as métricas de todos os workers em formato texto do Prometheus"""
+        own = f'{os.getpid()}.json'
+        snapshots = [self.snapshot()]
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if os.path.basename(path) == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue   # arquivo sendo trocado; entra no próximo scrape
+
+        lines = []
+        for name, metric in self._metrics.items():
+            merged = {}
+            for snapshot in snapshots:
+                for entry in snapshot.get(name, ()):
+                    labels = tuple(entry[0])
+                    value = entry[1:] if metric.type == 'histogram' else entry[1]
+                    merged[labels] = metric.merge(merged.get(labels), value)
+            lines.extend(metric.render(merged))
+        return '\n'.join(lines) + '\n'
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Normaliza um SQL para usar como rótulo (sem comentários nem listas de ?)"""
+    sql = re.sub(r'--[^\n]*', ' ', sql)
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)
+    sql = re.sub(r'(\(\?, \.\.\.\))(?:\s*,\s*\(\?, \.\.\.\))+', r'\1, ...', sql)
+    return sql[:200]
@@ -0,0 +1,239 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Sessões no servidor
+# O cookie leva só um id opaco; os dados ficam no SQLite com um LRU na frente
+# =====================================================
+
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+
+from database import get_db, native_lock, run_blocking
+
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 1000))
+SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', 15))
+
+
+def create_sessions_table(conn):
+    """Cria a tabela de sessões (chamado pelo init_db)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        validated_at REAL NOT NULL
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_sessions_validated
+        ON sessions (validated_at)''')
+
+
+def write_session(conn, sid, data, expires_at):
+    """Grava (ou substitui) uma sessão; `data` é o dict da sessão"""
+    user_id = (data.get('user') or {}).get('id')
+    conn.execute('''
+        INSERT INTO sessions (id, user_id, data, expires_at, validated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            user_id = excluded.user_id, data = excluded.data, expires_at = excluded.expires_at
+    ''', (sid, user_id and str(user_id), session_json_serializer.dumps(dict(data)), expires_at, time.time()))
+
+
+class SessionStore:
+    """Sessões no SQLite com um cache LRU por processo.
+
+    Leituras recentes (até `cache_ttl` segundos) saem do cache sem SQL; é
+    também o atraso máximo para um worker ver o logout, a expiração ou a
+    revalidação feitos por outro.
+    """
+
+    def __init__(self, cache_size=SESSION_CACHE_SIZE, cache_ttl=SESSION_CACHE_TTL):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._lock = native_lock()
+        self._cache = OrderedDict()     # sid -> (lido em, json, expires_at)
+
+    def get(self, sid):
+        """(dados, expires_at) de uma sessão válida, ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None and now - entry[0] < self.cache_ttl and entry[2] > now:
+                self._cache.move_to_end(sid)
+                return session_json_serializer.loads(entry[1]), entry[2]
+
+        row = run_blocking(self._load, sid, now)
+        if row is None:
+            self._forget(sid)
+            return None
+        self._remember(sid, row['data'], row['expires_at'])
+        return session_json_serializer.loads(row['data']), row['expires_at']
+
+    @staticmethod
+    def _load(sid, now):
+        with get_db() as conn:
+            return conn.execute(
+                "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?", (sid, now)
+            ).fetchone()
+
+    def save(self, sid, data, expires_at):
+        run_blocking(self._save, sid, data, expires_at)
+        self._remember(sid, session_json_serializer.dumps(dict(data)), expires_at)
+
+    @staticmethod
+    def _save(sid, data, expires_at):
+        with get_db() as conn:
+            write_session(conn, sid, data, expires_at)
+            conn.commit()
+
+    def touch(self, sid, expires_at):
+        """Estende a validade sem regravar os dados"""
+        def extend():
+            with get_db() as conn:
+                conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, sid))
+                conn.commit()
+        run_blocking(extend)
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                self._cache[sid] = (entry[0], entry[1], expires_at)
+
+    def delete(self, *sids):
+        def remove():
+            with get_db() as conn:
+                conn.executemany("DELETE FROM sessions WHERE id = ?", [(sid,) for sid in sids])
+                conn.commit()
+        run_blocking(remove)
+        self._forget(*sids)
+
+    def due_for_validation(self, validated_before, limit=500):
+        """Sessões válidas não conferidas desde `validated_before`: {user_id: [sid, ...]}"""
+        with get_db() as conn:
+            rows = conn.execute(
+                "SELECT id, user_id FROM sessions WHERE validated_at < ? AND expires_at > ? "
+                "AND user_id IS NOT NULL ORDER BY validated_at LIMIT ?",
+                (validated_before, time.time(), limit)
+            ).fetchall()
+        due = {}
+        for row in rows:
+            due.setdefault(row['user_id'], []).append(row['id'])
+        return due
+
+    def revalidate(self, sids, update):
+        """Aplica `update(dados)` às sessões e marca como conferidas agora"""
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for sid in sids:
+                row = conn.execute("SELECT data FROM sessions WHERE id = ?", (sid,)).fetchone()
+                if row is None:
+                    continue
+                data = session_json_serializer.loads(row['data'])
+                update(data)
+                conn.execute(
+                    "UPDATE sessions SET data = ?, validated_at = ? WHERE id = ?",
+                    (session_json_serializer.dumps(data), time.time(), sid)
+                )
+            conn.commit()
+        self._forget(*sids)
+
+    def prune(self):
+        """Apaga as sessões expiradas; retorna quantas"""
+        with get_db() as conn:
+            deleted = conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+            conn.commit()
+        return deleted
+
+    def _remember(self, sid, raw, expires_at):
+        with self._lock:
+            self._cache[sid] = (time.time(), raw, expires_at)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, *sids):
+        with self._lock:
+            for sid in sids:
+                self._cache.pop(sid, None)
+
+
+class ServerSession(SecureCookieSession):
+    """Sessão do Flask guardada no SessionStore, identificada por `sid`"""
+
+    def __init__(self, initial=None, sid=None, expires_at=0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.discarded_sid = None
+
+    def regenerate(self):
+        """Troca o id da sessão (no login), descartando o anterior"""
+        if self.sid is not None:
+            self.discarded_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Substitui o cookie assinado do Flask por um id aleatório + SessionStore.
+
+    A sessão expira após `PERMANENT_SESSION_LIFETIME` sem uso; a validade é
+    estendida no máximo uma vez a cada meia vida, para que os polls não
+    escrevam no banco a cada requisição. Sessões vazias não são gravadas.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            found = self.store.get(sid)
+            if found is not None:
+                data, expires_at = found
+                return ServerSession(data, sid=sid, expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        discarded = [session.discarded_sid] if session.discarded_sid else []
+        if not session:
+            if session.sid is not None and session.modified:
+                discarded.append(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            if discarded:
+                self.store.delete(*discarded)
+            return
+
+        if discarded:
+            self.store.delete(*discarded)
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if session.sid is None or session.modified:
+            session.sid = session.sid or secrets.token_urlsafe(24)
+            self.store.save(session.sid, session, now + lifetime)
+        elif session.expires_at - now < lifetime / 2:
+            self.store.touch(session.sid, now + lifetime)
+            if not session.permanent:
+                return
+        else:
+            return
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
@@ -0,0 +1,15 @@
+# =====================================================
+# CAOS TICKET DASHBOARD - Configuração dos testes
+# =====================================================
+
+import os
+import sys
+import tempfile
+
+# O app cria o schema ao ser importado: aponta os bancos para um diretório
+# temporário antes de qualquer `import app`.
+_tmpdir = tempfile.mkdtemp(prefix='caos-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_tmpdir, 'tickets.db')
+os.environ['ARCHIVE_DATABASE_PATH'] = os.path.join(_tmpdir, 'tickets_archive.db')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
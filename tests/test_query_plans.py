@@ -0,0 +1,25 @@
+# =====================================================
+# Planos das consultas frequentes (HOT_QUERIES)
+# =====================================================
+
+import pytest
+
+import app as dashboard
+from database import get_db
+
+
+@pytest.fixture(scope='module')
+def query_plans():
+    """Planos de todas as HOT_QUERIES num banco recém-criado pelo init_db"""
+    with get_db() as conn:
+        return dashboard.check_query_plans(conn)
+
+
+def test_every_hot_query_is_checked(query_plans):
+    assert set(query_plans) == set(dashboard.HOT_QUERIES)
+
+
+@pytest.mark.parametrize('name', sorted(dashboard.HOT_QUERIES))
+def test_hot_query_uses_index(query_plans, name):
+    ok, plan = query_plans[name]
+    assert ok, f"{name} faz SCAN ou ordenação temporária:\n" + '\n'.join(plan)